@@ -0,0 +1,100 @@
+import pickle
+import time
+
+import redis
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from core.lru import LRUCache
+
+from .models import CustomUser, UserSmtpCreds
+
+AUTH_CACHE_KEY = "auth-user:{}"
+
+
+class AuthCache:
+    def __init__(self, ttl=None, maxsize=None, client=None):
+        self.ttl = ttl or settings.AUTH_CACHE_TTL
+        self.local = LRUCache(maxsize=maxsize or settings.AUTH_CACHE_SIZE)
+        if client is None and settings.AUTH_CACHE_REDIS_URL:
+            client = redis.Redis.from_url(settings.AUTH_CACHE_REDIS_URL)
+        self.client = client
+
+    def fetch(self, user_id):
+        return (
+            CustomUser.objects.annotate(
+                has_smtp_creds=Exists(UserSmtpCreds.objects.filter(user=OuterRef("pk")))
+            )
+            .filter(**{api_settings.USER_ID_FIELD: user_id})
+            .first()
+        )
+
+    def get_shared(self, key):
+        if self.client is None:
+            return None
+        try:
+            data = self.client.get(key)
+        except redis.RedisError:
+            return None
+        return pickle.loads(data) if data else None
+
+    def set_shared(self, key, entry):
+        if self.client is None:
+            return
+        try:
+            self.client.set(key, pickle.dumps(entry), ex=self.ttl)
+        except redis.RedisError:
+            pass
+
+    def get(self, user_id):
+        key = AUTH_CACHE_KEY.format(user_id)
+        entry = self.local.get(key)
+        if entry is None or entry[0] <= time.time():
+            entry = self.get_shared(key)
+            if entry is None or entry[0] <= time.time():
+                user = self.fetch(user_id)
+                if user is None:
+                    return None
+                entry = (time.time() + self.ttl, pickle.dumps(user))
+                self.set_shared(key, entry)
+            self.local.set(key, entry)
+        # Every request gets its own copy, so relations cached on one request's
+        # user never leak into another.
+        return pickle.loads(entry[1])
+
+    def invalidate(self, user_id):
+        key = AUTH_CACHE_KEY.format(user_id)
+        self.local.pop(key)
+        if self.client is None:
+            return
+        try:
+            self.client.delete(key)
+        except redis.RedisError:
+            pass
+
+    def clear(self):
+        self.local.clear()
+
+
+auth_cache = AuthCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = auth_cache.get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+
+from core.lru import LRUCache
+
+from .utils import decrypt
+
+
+class CredentialCache:
+    def __init__(self, ttl=None, maxsize=None):
+        self.ttl = ttl or settings.SMTP_CREDS_CACHE_TTL
+        self.local = LRUCache(maxsize=maxsize or settings.SMTP_CREDS_CACHE_SIZE)
+
+    def get_password(self, smtp_creds):
+        entry = self.local.get(smtp_creds.id)
+        if entry is not None:
+            version, expires, password = entry
+            if version == smtp_creds.updated_at and expires > time.monotonic():
+                return password
+
+        password = decrypt(smtp_creds._password)
+        if smtp_creds.id is not None:
+            self.local.set(
+                smtp_creds.id,
+                (smtp_creds.updated_at, time.monotonic() + self.ttl, password),
+            )
+        return password
+
+    def invalidate(self, smtp_creds_id):
+        self.local.pop(smtp_creds_id)
+
+    def clear(self):
+        self.local.clear()
+
+
+credential_cache = CredentialCache()
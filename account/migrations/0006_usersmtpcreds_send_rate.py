@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_rename_email_usersmtpcreds_username_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersmtpcreds',
+            name='send_burst',
+            field=models.PositiveIntegerField(blank=True, help_text='Bucket size, defaults to SMTP_ACCOUNT_BURST', null=True),
+        ),
+        migrations.AddField(
+            model_name='usersmtpcreds',
+            name='send_rate',
+            field=models.FloatField(blank=True, help_text='Messages per second, defaults to SMTP_ACCOUNT_RATE', null=True),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
-from .utils import encrypt, decrypt
+from .credentials import credential_cache
+from .utils import encrypt
 from .managers import UserManager
 
 
@@ -33,14 +34,25 @@ class UserSmtpCreds(models.Model):
     port = models.IntegerField()
     use_tls = models.BooleanField(default=True)
     use_ssl = models.BooleanField(default=False)
+    send_rate = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Messages per second, defaults to SMTP_ACCOUNT_RATE",
+    )
+    send_burst = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Bucket size, defaults to SMTP_ACCOUNT_BURST",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def set_password(self, _password):
         self._password = encrypt(_password)
+        credential_cache.invalidate(self.id)
 
     def get_password(self):
-        return decrypt(self._password)
+        return credential_cache.get_password(self)
 
     @property
     def password(self):
@@ -44,6 +44,8 @@ class UserSmtpCredSerializer(serializers.ModelSerializer):
             "port",
             "use_tls",
             "use_ssl",
+            "send_rate",
+            "send_burst",
             "created_at",
             "updated_at",
         ]
@@ -61,11 +63,12 @@ class UserSmtpCredSerializer(serializers.ModelSerializer):
         return smtp_creds
 
     def update(self, instance, validated_data):
-        password = validated_data.pop("_password")
+        password = validated_data.pop("_password", None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        instance.set_password(password)
+        if password is not None:
+            instance.set_password(password)
         instance.save()
         return instance
 
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import auth_cache
+from .models import CustomUser, UserSmtpCreds
+
+
+def invalidate_auth_cache(user_id):
+    transaction.on_commit(lambda: auth_cache.invalidate(user_id))
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_auth_cache(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserSmtpCreds)
+def invalidate_smtp_creds_owner(sender, instance, **kwargs):
+    invalidate_auth_cache(instance.user_id)
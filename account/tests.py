@@ -1,3 +1,99 @@
+from unittest import mock
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.testing import QueryBudgetMixin, auth_client
+
+from .authentication import auth_cache
+from .credentials import CredentialCache, credential_cache
+from .models import CustomUser, UserSmtpCreds
+
+
+class AccountQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email="owner@example.com", name="Owner", password="secret"
+        )
+        smtp_creds = UserSmtpCreds(
+            user=cls.user, username=cls.user.email, host="smtp.example.com", port=587
+        )
+        smtp_creds.set_password("secret")
+        smtp_creds.save()
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def test_profile_endpoints(self):
+        self.assertQueryBudget(self.client, 0, "/account/api/register/")
+        self.assertQueryBudget(self.client, 1, "/account/api/smtp-creds/")
+
+    def test_cold_auth_loads_user_and_smtp_flag_in_one_query(self):
+        auth_cache.clear()
+        self.assertQueryBudget(self.client, 2, "/core/api/import-jobs/")
+        self.assertQueryBudget(self.client, 1, "/core/api/import-jobs/")
+        self.assertQueryBudget(self.client, 0, "/account/api/register/")
+
+    def test_saving_smtp_creds_invalidates_cached_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.smtp_creds.delete()
+        response = self.client.get("/core/api/import-jobs/")
+        self.assertEqual(response.status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/account/api/smtp-creds/",
+                {
+                    "username": self.user.email,
+                    "_password": "secret",
+                    "host": "smtp.example.com",
+                    "port": 587,
+                },
+                format="json",
+            )
+        self.assertQueryBudget(self.client, 2, "/core/api/import-jobs/")
+
+    def test_login_and_register(self):
+        self.assertQueryBudget(
+            APIClient(),
+            2,
+            "/account/api/login/",
+            method="post",
+            data={"email": self.user.email, "password": "secret"},
+        )
+        self.assertQueryBudget(
+            APIClient(),
+            4,
+            "/account/api/register/",
+            method="post",
+            data={"email": "new@example.com", "name": "New", "password": "secret"},
+        )
+
+    def test_updating_smtp_creds_flushes_decrypted_password(self):
+        self.assertEqual(self.user.smtp_creds.password, "secret")
+        self.assertQueryBudget(
+            self.client,
+            3,
+            "/account/api/smtp-creds/",
+            method="patch",
+            data={"_password": "rotated"},
+        )
+        smtp_creds = UserSmtpCreds.objects.get(user=self.user)
+        self.assertEqual(smtp_creds.password, "rotated")
+        self.assertEqual(credential_cache.get_password(smtp_creds), "rotated")
+
+
+class CredentialCacheTests(TestCase):
+    @mock.patch("account.credentials.decrypt", return_value="secret")
+    @mock.patch("account.credentials.time.monotonic", return_value=100)
+    def test_cached_password_expires_after_ttl(self, monotonic, decrypt):
+        smtp_creds = UserSmtpCreds(id=1, _password="encrypted")
+        cache = CredentialCache(ttl=10)
+        cache.get_password(smtp_creds)
+        cache.get_password(smtp_creds)
+        self.assertEqual(decrypt.call_count, 1)
 
-# Create your tests here.
+        monotonic.return_value = 111
+        self.assertEqual(cache.get_password(smtp_creds), "secret")
+        self.assertEqual(decrypt.call_count, 2)
@@ -3,6 +3,7 @@ from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
+from .credentials import credential_cache
 from .serializers import UserSerializer, UserSmtpCredSerializer
 from .models import UserSmtpCreds
 
@@ -35,8 +36,27 @@ class UserSmtpCredsView(GenericAPIView):
         serializer.is_valid(raise_exception=True)
         serializer.save(user=user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    
-    
+
+    def put(self, request):
+        return self.update(request, partial=False)
+
+    def patch(self, request):
+        return self.update(request, partial=True)
+
+    def update(self, request, partial):
+        try:
+            smtp_creds = request.user.smtp_creds
+        except UserSmtpCreds.DoesNotExist:
+            return Response(
+                {"detail": "SMTP credentials not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        serializer = self.get_serializer(smtp_creds, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        credential_cache.invalidate(smtp_creds.id)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     def get(self, request):
         user = request.user
@@ -0,0 +1,156 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .caching import invalidate_responses
+from .models import Campaign, CampaignRecipient, EmailMailList
+
+RECIPIENT_TABLE = CampaignRecipient._meta.db_table
+CAMPAIGN_TABLE = Campaign._meta.db_table
+CAMPAIGN_LISTS_TABLE = Campaign.maillists.through._meta.db_table
+MEMBER_TABLE = EmailMailList._meta.db_table
+
+# Expects a "removed" CTE yielding the campaign_id of each deleted recipient.
+DISCOUNT_SQL = f"""
+    UPDATE {CAMPAIGN_TABLE} c
+    SET recipient_count = c.recipient_count - removed.count
+    FROM (
+        SELECT campaign_id, count(*) AS count FROM removed GROUP BY campaign_id
+    ) removed
+    WHERE c.id = removed.campaign_id
+    RETURNING c.user_id
+"""
+
+
+def build_filters(conditions):
+    sql = "".join(f" AND {condition}" for condition, _ in conditions)
+    params = [list(value) for _, value in conditions if value is not None]
+    return sql, params
+
+
+def add_recipients(
+    campaign_ids=None, maillist_ids=None, email_ids=None, email_query=None
+):
+    conditions = []
+    if campaign_ids is not None:
+        conditions.append(("cm.campaign_id = ANY(%s)", campaign_ids))
+    if maillist_ids is not None:
+        conditions.append(("eml.maillist_id = ANY(%s)", maillist_ids))
+    if email_ids is not None:
+        conditions.append(("eml.email_id = ANY(%s)", email_ids))
+    if email_query is not None:
+        conditions.append((f"eml.email_id IN ({email_query})", None))
+    filters, params = build_filters(conditions)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH added AS (
+                INSERT INTO {RECIPIENT_TABLE} (campaign_id, email_id, created_at)
+                SELECT cm.campaign_id, eml.email_id, now()
+                FROM {MEMBER_TABLE} eml
+                JOIN {CAMPAIGN_LISTS_TABLE} cm ON cm.maillist_id = eml.maillist_id
+                JOIN {CAMPAIGN_TABLE} c ON c.id = cm.campaign_id
+                WHERE c.audience_frozen_at IS NOT NULL
+                    AND eml.unsubscribed_at IS NULL{filters}
+                ON CONFLICT (campaign_id, email_id) DO NOTHING
+                RETURNING campaign_id
+            )
+            UPDATE {CAMPAIGN_TABLE} c
+            SET recipient_count = c.recipient_count + added.count
+            FROM (
+                SELECT campaign_id, count(*) AS count FROM added GROUP BY campaign_id
+            ) added
+            WHERE c.id = added.campaign_id
+            RETURNING c.user_id
+            """,
+            params,
+        )
+        invalidate_responses("campaigns", [row[0] for row in cursor.fetchall()])
+
+
+def prune_recipients(campaign_ids=None, maillist_ids=None, email_ids=None):
+    conditions = []
+    if campaign_ids is not None:
+        conditions.append(("cr.campaign_id = ANY(%s)", campaign_ids))
+    if maillist_ids is not None:
+        conditions.append(
+            (
+                f"cr.campaign_id IN (SELECT campaign_id FROM {CAMPAIGN_LISTS_TABLE} "
+                "WHERE maillist_id = ANY(%s))",
+                maillist_ids,
+            )
+        )
+    if email_ids is not None:
+        conditions.append(("cr.email_id = ANY(%s)", email_ids))
+    filters, params = build_filters(conditions)
+
+    # Recipients stay while the email is still subscribed to any other list
+    # of the campaign.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH removed AS (
+                DELETE FROM {RECIPIENT_TABLE} cr
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM {MEMBER_TABLE} eml
+                    JOIN {CAMPAIGN_LISTS_TABLE} cm ON cm.maillist_id = eml.maillist_id
+                    WHERE cm.campaign_id = cr.campaign_id
+                        AND eml.email_id = cr.email_id
+                        AND eml.unsubscribed_at IS NULL
+                ){filters}
+                RETURNING campaign_id
+            )
+            {DISCOUNT_SQL}
+            """,
+            params,
+        )
+        invalidate_responses("campaigns", [row[0] for row in cursor.fetchall()])
+
+
+def sync_recipients(maillist_ids, email_ids):
+    # Called for saved membership changes. Adding skips unsubscribed members
+    # and pruning keeps emails still active in another campaign list.
+    add_recipients(maillist_ids=list(maillist_ids), email_ids=list(email_ids))
+    prune_recipients(maillist_ids=list(maillist_ids), email_ids=list(email_ids))
+
+
+def remove_email_recipients(email_ids):
+    # Recipients cascade with their email, so they are deleted and counted
+    # out before the email itself is deleted.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH removed AS (
+                DELETE FROM {RECIPIENT_TABLE}
+                WHERE email_id = ANY(%s)
+                RETURNING campaign_id
+            )
+            {DISCOUNT_SQL}
+            """,
+            [list(email_ids)],
+        )
+        invalidate_responses("campaigns", [row[0] for row in cursor.fetchall()])
+
+
+def freeze_audience(campaign):
+    with transaction.atomic():
+        Campaign.objects.filter(id=campaign.id).update(
+            audience_frozen_at=timezone.now(), recipient_count=0
+        )
+        CampaignRecipient.objects.filter(campaign_id=campaign.id).delete()
+        add_recipients(campaign_ids=[campaign.id])
+        invalidate_responses("campaigns", [campaign.user_id])
+    campaign.refresh_from_db(fields=["audience_frozen_at", "recipient_count"])
+    return campaign
+
+
+def unfreeze_audience(campaign):
+    with transaction.atomic():
+        Campaign.objects.filter(id=campaign.id).update(
+            audience_frozen_at=None, recipient_count=0
+        )
+        CampaignRecipient.objects.filter(campaign_id=campaign.id).delete()
+        invalidate_responses("campaigns", [campaign.user_id])
+    campaign.refresh_from_db(fields=["audience_frozen_at", "recipient_count"])
+    return campaign
@@ -0,0 +1,124 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+VERSION_KEY = "response-cache:{}:{}:version"
+RESPONSE_KEY = "response-cache:{}:{}:{}:{}"
+STATS_KEY = "response-cache:stats:{}:{}"
+OUTCOMES = ("hits", "misses")
+RESOURCES = ("campaigns", "maillists", "templates")
+# Validators are stored with the body so a hit can answer conditional
+# requests without recomputing them from the database.
+CACHED_HEADERS = ("ETag",)
+
+
+def new_version():
+    # Versions restart from the clock rather than 1, so a version key that was
+    # evicted can never point back at responses cached under an old version.
+    return time.time_ns()
+
+
+def get_version(resource, user_id):
+    key = VERSION_KEY.format(resource, user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(resource, user_ids):
+    for user_id in user_ids:
+        key = VERSION_KEY.format(resource, user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), timeout=None)
+
+
+def invalidate_responses(resource, user_ids):
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: bump_versions(resource, user_ids))
+
+
+def count(resource, outcome):
+    key = STATS_KEY.format(resource, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_stats(resources):
+    keys = {
+        STATS_KEY.format(resource, outcome): (resource, outcome)
+        for resource in resources
+        for outcome in OUTCOMES
+    }
+    values = cache.get_many(list(keys))
+    stats = {resource: dict.fromkeys(OUTCOMES, 0) for resource in resources}
+    for key, (resource, outcome) in keys.items():
+        stats[resource][outcome] = values.get(key, 0)
+    return stats
+
+
+def reset_stats(resources):
+    cache.delete_many(
+        [
+            STATS_KEY.format(resource, outcome)
+            for resource in resources
+            for outcome in OUTCOMES
+        ]
+    )
+
+
+class CachedResponseMixin:
+    cache_resource = None
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_TTL:
+            return handler(request, *args, **kwargs)
+
+        user_id = request.user.id
+        version = get_version(self.cache_resource, user_id)
+        digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = RESPONSE_KEY.format(self.cache_resource, user_id, version, digest)
+
+        entry = cache.get(key)
+        if entry is not None:
+            count(self.cache_resource, "hits")
+            data, headers = entry
+            if headers:
+                not_modified = get_conditional_response(
+                    request, etag=headers.get("ETag")
+                )
+                if not_modified is not None:
+                    not_modified["X-Cache"] = "HIT"
+                    return not_modified
+            return Response(data, headers={**headers, "X-Cache": "HIT"})
+
+        count(self.cache_resource, "misses")
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {
+                name: response[name]
+                for name in CACHED_HEADERS
+                if response.has_header(name)
+            }
+            cache.set(
+                key, (response.data, headers), timeout=settings.RESPONSE_CACHE_TTL
+            )
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,92 @@
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import (
+    DNS_NAME,
+    forbid_multi_line_headers,
+    sanitize_address,
+)
+
+from .lru import LRUCache
+from .models import Campaign
+
+PER_RECIPIENT_HEADERS = ("From", "To", "Date", "Message-ID")
+
+
+class CampaignContent:
+    def __init__(self, campaign):
+        self.version = campaign.updated_at
+        self.subject = campaign.subject
+        self.body = campaign.body
+        if not self.body and campaign.template:
+            self.body = campaign.template.html_content
+        self.attachments = [
+            attachment.file.path for attachment in campaign.attachments.all()
+        ]
+
+
+class PreparedMessage:
+    def __init__(self, from_email, recipients, data):
+        self.from_email = from_email
+        self.recipients = recipients
+        self.data = data
+
+
+class MessagePrototype:
+    def __init__(self, content):
+        email = EmailMessage(content.subject, content.body)
+        for path in content.attachments:
+            email.attach_file(path)
+
+        message = email.message()
+        for header in PER_RECIPIENT_HEADERS:
+            del message[header]
+
+        self.version = content.version
+        self.encoding = email.encoding or settings.DEFAULT_CHARSET
+        self.data = message.as_bytes(linesep="\r\n")
+
+    def __len__(self):
+        return len(self.data)
+
+    def render(self, sender, to):
+        headers = [
+            forbid_multi_line_headers("From", sender, self.encoding),
+            forbid_multi_line_headers("To", to, self.encoding),
+            ("Date", formatdate(localtime=settings.EMAIL_USE_LOCALTIME)),
+            ("Message-ID", make_msgid(domain=DNS_NAME)),
+        ]
+        head = "".join(
+            f"{name}: {value}\r\n".replace("\n ", "\r\n ") for name, value in headers
+        )
+        return PreparedMessage(
+            sanitize_address(sender, self.encoding),
+            [sanitize_address(to, self.encoding)],
+            head.encode() + self.data,
+        )
+
+
+content_cache = LRUCache(maxsize=settings.CAMPAIGN_CONTENT_CACHE_SIZE)
+prototype_cache = LRUCache(maxbytes=settings.CAMPAIGN_MESSAGE_CACHE_BYTES, sizeof=len)
+
+
+def get_campaign_content(campaign_id, updated_at):
+    content = content_cache.get(campaign_id)
+    if content is None or content.version != updated_at:
+        campaign = (
+            Campaign.objects.select_related("template")
+            .prefetch_related("attachments")
+            .get(id=campaign_id)
+        )
+        content = CampaignContent(campaign)
+        content_cache.set(campaign_id, content)
+    return content
+
+
+def get_message_prototype(campaign_id, updated_at):
+    prototype = prototype_cache.get(campaign_id)
+    if prototype is None or prototype.version != updated_at:
+        prototype = MessagePrototype(get_campaign_content(campaign_id, updated_at))
+        prototype_cache.set(campaign_id, prototype)
+    return prototype
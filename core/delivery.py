@@ -0,0 +1,148 @@
+import asyncio
+from collections import defaultdict
+
+import aiosmtplib
+from django.conf import settings
+
+from .ratelimit import limiter as default_limiter
+from .ratelimit import slots as default_slots
+from .smtp import pool_key
+
+DISCONNECT_ERRORS = (aiosmtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class AsyncDeliveryEngine:
+    # Concurrency per host and per account is capped across every batch and
+    # worker by slots held in Redis. The local semaphores only keep a batch
+    # from polling for more slots than it could ever be given.
+    def __init__(
+        self,
+        host_concurrency=None,
+        account_concurrency=None,
+        timeout=None,
+        limiter=None,
+        slots=None,
+    ):
+        self.host_concurrency = (
+            host_concurrency or settings.ASYNC_DELIVERY_HOST_CONCURRENCY
+        )
+        self.account_concurrency = (
+            account_concurrency or settings.ASYNC_DELIVERY_ACCOUNT_CONCURRENCY
+        )
+        self.timeout = timeout or settings.ASYNC_DELIVERY_TIMEOUT
+        self.limiter = limiter or default_limiter
+        self.slots = slots or default_slots
+        self._host_limits = {}
+        self._account_limits = {}
+        self._idle = defaultdict(list)
+        self._throttled = {}
+
+    def _limit(self, limits, key, size):
+        if key not in limits:
+            limits[key] = asyncio.Semaphore(size)
+        return limits[key]
+
+    async def _connect(self, smtp_creds):
+        login = smtp_creds.username and smtp_creds.password
+        client = aiosmtplib.SMTP(
+            hostname=smtp_creds.host,
+            port=smtp_creds.port,
+            username=smtp_creds.username if login else None,
+            password=smtp_creds.password if login else None,
+            use_tls=smtp_creds.use_ssl,
+            start_tls=smtp_creds.use_tls,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        return client
+
+    async def _sendmail(self, key, smtp_creds, message):
+        client = self._idle[key].pop() if self._idle[key] else None
+        if client is None or not client.is_connected:
+            client = await self._connect(smtp_creds)
+
+        try:
+            await client.sendmail(message.from_email, message.recipients, message.data)
+        except DISCONNECT_ERRORS:
+            client.close()
+            client = await self._connect(smtp_creds)
+            await client.sendmail(message.from_email, message.recipients, message.data)
+        finally:
+            if client.is_connected:
+                self._idle[key].append(client)
+
+    async def _acquire(self, smtp_creds):
+        # The limiter talks to Redis synchronously, so it runs off the loop.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.limiter.acquire, smtp_creds)
+
+    async def _claim_slot(self, smtp_creds):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.ASYNC_DELIVERY_SLOT_WAIT
+        while True:
+            token = await loop.run_in_executor(None, self.slots.acquire, smtp_creds)
+            if token or loop.time() >= deadline:
+                return token
+            await asyncio.sleep(settings.ASYNC_DELIVERY_SLOT_POLL)
+
+    async def _release_slot(self, smtp_creds, token):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.slots.release, smtp_creds, token)
+
+    async def send(self, smtp_creds, message):
+        key = pool_key(smtp_creds)
+        host_limit = self._limit(
+            self._host_limits, smtp_creds.host, self.host_concurrency
+        )
+        account_limit = self._limit(self._account_limits, key, self.account_concurrency)
+
+        async with host_limit, account_limit:
+            if key in self._throttled:
+                return False, self._throttled[key]
+            token = await self._claim_slot(smtp_creds)
+            if token is None:
+                self._throttled[key] = settings.ASYNC_DELIVERY_SLOT_WAIT
+                return False, settings.ASYNC_DELIVERY_SLOT_WAIT
+            try:
+                wait = await self._acquire(smtp_creds)
+                if wait:
+                    self._throttled[key] = wait
+                    return False, wait
+                await self._sendmail(key, smtp_creds, message)
+            except Exception:
+                return False, 0
+            finally:
+                await self._release_slot(smtp_creds, token)
+        return True, 0
+
+    async def close(self):
+        clients = [client for clients in self._idle.values() for client in clients]
+        self._idle.clear()
+        for client in clients:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+    async def deliver(self, messages):
+        try:
+            results = await asyncio.gather(
+                *(self.send(smtp_creds, message) for _, smtp_creds, message in messages)
+            )
+        finally:
+            await self.close()
+
+        sent_ids = []
+        failed_ids = []
+        deferred_ids = []
+        countdown = 0
+        for (mail_id, _, _), (sent, wait) in zip(messages, results):
+            if wait:
+                deferred_ids.append(mail_id)
+                countdown = max(countdown, wait)
+            else:
+                (sent_ids if sent else failed_ids).append(mail_id)
+        return sent_ids, failed_ids, deferred_ids, countdown
+
+    def run(self, messages):
+        return asyncio.run(self.deliver(messages))
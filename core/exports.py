@@ -0,0 +1,54 @@
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .utils import chunked
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for batch in chunked(rows, settings.EXPORT_CHUNK_SIZE):
+        yield "".join(
+            writer.writerow([format_value(value) for value in row]) for row in batch
+        )
+
+
+def iter_ndjson(rows, fields):
+    encoder = DjangoJSONEncoder()
+    for batch in chunked(rows, settings.EXPORT_CHUNK_SIZE):
+        yield "".join(encoder.encode(dict(zip(fields, row))) + "\n" for row in batch)
+
+
+def export_response(queryset, fields, fmt, filename):
+    rows = queryset.values_list(*fields.values()).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    if fmt == "ndjson":
+        content = iter_ndjson(rows, list(fields))
+    else:
+        content = iter_csv(rows, list(fields))
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,682 @@
+import codecs
+import csv
+import hashlib
+import io
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from xml.etree import ElementTree
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from django.conf import settings
+from django.contrib.auth.base_user import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .audience import add_recipients
+from .members import count_added_members
+from .models import Email, EmailMailList, ImportJob
+from .utils import chunked
+
+EMAIL_MAX_LENGTH = Email._meta.get_field("email").max_length
+NAME_MAX_LENGTH = Email._meta.get_field("first_name").max_length
+
+
+SPREADSHEET_FORMATS = (".xlsx", ".ods")
+IMPORT_FORMATS = (".csv",) + SPREADSHEET_FORMATS
+
+COLUMN_ALIASES = {
+    "email": ("email", "e_mail", "email_address", "mail"),
+    "first_name": ("first_name", "firstname", "first", "given_name"),
+    "last_name": ("last_name", "lastname", "last", "surname", "family_name"),
+}
+
+IMPORT_FILE_ERRORS = (
+    UnicodeDecodeError,
+    csv.Error,
+    zipfile.BadZipFile,
+    ElementTree.ParseError,
+    InvalidFileException,
+)
+
+ODS_TABLE = "{urn:oasis:names:tc:opendocument:xmlns:table:1.0}"
+ODS_TEXT = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+
+def get_file_format(name):
+    return os.path.splitext(name)[1].lower()
+
+
+def map_columns(header):
+    names = [
+        re.sub(r"[^a-z0-9]+", "_", str(value or "").lower()).strip("_")
+        for value in header
+    ]
+    columns = tuple(
+        next((index for index, name in enumerate(names) if name in aliases), None)
+        for aliases in COLUMN_ALIASES.values()
+    )
+    if columns[0] is None:
+        # No recognisable header, fall back to email, first and last name.
+        return (0, 1, 2)
+    return columns
+
+
+def apply_columns(row, columns):
+    values = []
+    for index in columns:
+        value = row[index] if index is not None and index < len(row) else None
+        values.append("" if value is None else str(value))
+    return values
+
+
+def read_csv_header(file):
+    file.seek(0)
+    line = file.readline()
+    header = line.removeprefix(codecs.BOM_UTF8).decode("utf-8")
+    return map_columns(next(csv.reader([header]), [])), len(line)
+
+
+class CSVFileReader:
+    def __init__(self, file, offset=0):
+        self.file = file
+        self.columns, header_size = read_csv_header(file)
+        self.offset = max(offset, header_size)
+
+    def lines(self):
+        self.file.seek(self.offset)
+        # Django's File.__iter__ rewinds to the start, so read line by line.
+        for line in iter(self.file.readline, b""):
+            self.offset += len(line)
+            yield line.decode("utf-8")
+
+    def __iter__(self):
+        for row in csv.reader(self.lines()):
+            yield apply_columns(row, self.columns)
+
+
+def open_xlsx_workbook(file):
+    try:
+        return openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except KeyError as e:
+        raise InvalidFileException(f"Missing workbook part {e}") from e
+
+
+def iter_xlsx_rows(file):
+    workbook = open_xlsx_workbook(file)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def count_xlsx_rows(file):
+    # Read-only sheets only parse the dimension element for this, which is
+    # missing from files some writers produce.
+    workbook = open_xlsx_workbook(file)
+    try:
+        return workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+
+
+def ods_text(element):
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag == f"{ODS_TEXT}s":
+            parts.append(" " * int(child.get(f"{ODS_TEXT}c", 1)))
+        elif child.tag == f"{ODS_TEXT}tab":
+            parts.append("\t")
+        elif child.tag == f"{ODS_TEXT}line-break":
+            parts.append("\n")
+        else:
+            parts.append(ods_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def ods_row_values(row):
+    values = []
+    blanks = 0
+    for cell in row:
+        if cell.tag not in (f"{ODS_TABLE}table-cell", f"{ODS_TABLE}covered-table-cell"):
+            continue
+        text = "\n".join(ods_text(p) for p in cell.iter(f"{ODS_TEXT}p"))
+        repeat = int(cell.get(f"{ODS_TABLE}number-columns-repeated", 1))
+        # Trailing blank cells are often repeated thousands of times.
+        if not text:
+            blanks += repeat
+            continue
+        values.extend([""] * blanks)
+        values.extend([text] * repeat)
+        blanks = 0
+    return values
+
+
+def open_ods_content(archive):
+    try:
+        return archive.open("content.xml")
+    except KeyError as e:
+        raise zipfile.BadZipFile("Missing content.xml") from e
+
+
+def iter_ods_rows(file):
+    with zipfile.ZipFile(file) as archive, open_ods_content(archive) as content:
+        parents = []
+        for event, element in ElementTree.iterparse(content, ("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag == f"{ODS_TABLE}table":
+                return
+            if element.tag != f"{ODS_TABLE}table-row":
+                continue
+            values = ods_row_values(element)
+            repeat = int(element.get(f"{ODS_TABLE}number-rows-repeated", 1))
+            # Drop parsed rows from the tree so memory stays flat on big sheets.
+            element.clear()
+            parents[-1].remove(element)
+            if values:
+                for _ in range(repeat):
+                    yield values
+
+
+def iter_spreadsheet_rows(file, file_format):
+    if file_format == ".ods":
+        rows = iter_ods_rows(file)
+    else:
+        rows = iter_xlsx_rows(file)
+    for row in rows:
+        if any(value not in (None, "") for value in row):
+            yield row
+
+
+def clean_name(value):
+    return value.replace("\x00", "").strip()[:NAME_MAX_LENGTH]
+
+
+def normalize_row(row):
+    if not row:
+        return None
+
+    email = BaseUserManager.normalize_email(row[0].strip())
+    if len(email) > EMAIL_MAX_LENGTH:
+        return None
+    try:
+        validate_email(email)
+    except ValidationError:
+        return None
+
+    first_name = clean_name(row[1]) if len(row) > 1 else ""
+    last_name = clean_name(row[2]) if len(row) > 2 else ""
+    return email, first_name, last_name
+
+
+def error_sample(number, row):
+    return {"row": number, "value": ",".join(row)[:255]}
+
+
+def count_invalid(summary, row):
+    summary["invalid"] += 1
+    if len(summary["samples"]) < settings.IMPORT_ERROR_SAMPLES:
+        summary["samples"].append(error_sample(summary["rows"], row))
+
+
+def normalize_chunk(rows, summary):
+    contacts = {}
+    for row in rows:
+        summary["rows"] += 1
+        contact = normalize_row(row)
+        if contact is None:
+            count_invalid(summary, row)
+        elif contact[0] in contacts:
+            summary["duplicates"] += 1
+        else:
+            contacts[contact[0]] = contact
+    return contacts
+
+
+def import_contacts(contacts, maillist):
+    email_ids = dict(
+        Email.objects.filter(email__in=contacts).values_list("email", "id")
+    )
+    missing = [
+        Email(email=email, first_name=first_name, last_name=last_name)
+        for email, first_name, last_name in contacts.values()
+        if email not in email_ids
+    ]
+
+    with transaction.atomic():
+        if missing:
+            Email.objects.bulk_create(missing, ignore_conflicts=True)
+            email_ids.update(
+                Email.objects.filter(
+                    email__in=[email.email for email in missing]
+                ).values_list("email", "id")
+            )
+
+        linked = EmailMailList.objects.filter(
+            maillist=maillist, email_id__in=email_ids.values()
+        ).count()
+        EmailMailList.objects.bulk_create(
+            [
+                EmailMailList(email_id=email_id, maillist=maillist)
+                for email_id in email_ids.values()
+            ],
+            ignore_conflicts=True,
+        )
+        count_added_members(maillist.id, len(email_ids) - linked)
+        add_recipients(maillist_ids=[maillist.id], email_ids=email_ids.values())
+
+    return {
+        "inserted": len(missing),
+        "existing": len(contacts) - len(missing),
+    }
+
+
+def new_summary():
+    return {
+        "rows": 0,
+        "inserted": 0,
+        "existing": 0,
+        "invalid": 0,
+        "duplicates": 0,
+        "samples": [],
+    }
+
+
+def import_rows_orm(rows, maillist, chunk_size=None):
+    summary = new_summary()
+
+    for chunk in chunked(rows, chunk_size or settings.IMPORT_CHUNK_SIZE):
+        result = import_contacts(normalize_chunk(chunk, summary), maillist)
+        summary["inserted"] += result["inserted"]
+        summary["existing"] += result["existing"]
+
+    return summary
+
+
+class CopyStream:
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+
+    def read(self, size=-1):
+        while size < 0 or self.buffer.tell() < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def iter_valid_contacts(rows, summary):
+    for row in rows:
+        summary["rows"] += 1
+        contact = normalize_row(row)
+        if contact is None:
+            count_invalid(summary, row)
+        else:
+            yield contact
+
+
+def copy_contacts(contacts, maillist):
+    email_table = Email._meta.db_table
+    link_table = EmailMailList._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE import_staging "
+            "(id bigserial, email text, first_name text, last_name text) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY import_staging (email, first_name, last_name) "
+            "FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (first_name, last_name))",
+            CopyStream(contacts),
+        )
+
+        cursor.execute("SELECT count(DISTINCT email) FROM import_staging")
+        unique = cursor.fetchone()[0]
+
+        cursor.execute(f"""
+            WITH inserted AS (
+                INSERT INTO {email_table}
+                    (email, first_name, last_name, created_at, updated_at)
+                SELECT DISTINCT ON (email) email, first_name, last_name, now(), now()
+                FROM import_staging
+                ORDER BY email, id
+                ON CONFLICT (email) DO NOTHING
+                RETURNING id
+            )
+            SELECT count(*) FROM inserted
+            """)
+        inserted = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"""
+            INSERT INTO {link_table} (email_id, maillist_id, created_at)
+            SELECT e.id, %s, now()
+            FROM {email_table} e
+            JOIN (SELECT DISTINCT email FROM import_staging) s ON s.email = e.email
+            ON CONFLICT (email_id, maillist_id) DO NOTHING
+            """,
+            [maillist.id],
+        )
+        count_added_members(maillist.id, cursor.rowcount)
+        add_recipients(
+            maillist_ids=[maillist.id],
+            email_query=f"SELECT e.id FROM {email_table} e "
+            "JOIN import_staging s ON s.email = e.email",
+        )
+        cursor.execute("DROP TABLE import_staging")
+
+    return unique, inserted
+
+
+def import_rows_copy(rows, maillist):
+    summary = new_summary()
+    unique, inserted = copy_contacts(iter_valid_contacts(rows, summary), maillist)
+    summary["inserted"] = inserted
+    summary["existing"] = unique - inserted
+    summary["duplicates"] = summary["rows"] - summary["invalid"] - unique
+    return summary
+
+
+def use_copy(mode):
+    return mode == "copy" and connection.vendor == "postgresql"
+
+
+def import_rows(rows, maillist, chunk_size=None, mode=None):
+    if use_copy(mode or settings.EMAIL_IMPORT_MODE):
+        return import_rows_copy(rows, maillist)
+    return import_rows_orm(rows, maillist, chunk_size)
+
+
+def store_contacts(contacts, maillist, mode=None):
+    if use_copy(mode or settings.EMAIL_IMPORT_MODE):
+        unique, inserted = copy_contacts(contacts.values(), maillist)
+        return {"inserted": inserted, "existing": unique - inserted}
+
+    result = {"inserted": 0, "existing": 0}
+    for part in chunked(contacts.items(), settings.IMPORT_CHUNK_SIZE):
+        part_result = import_contacts(dict(part), maillist)
+        result["inserted"] += part_result["inserted"]
+        result["existing"] += part_result["existing"]
+    return result
+
+
+def get_import_workers(size, name):
+    if get_file_format(name) != ".csv" or size < settings.IMPORT_PARALLEL_MIN_BYTES:
+        return 1
+    return settings.IMPORT_PARSE_WORKERS
+
+
+def split_ranges(path, start, shard_bytes):
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, "rb") as file:
+        while bounds[-1] + shard_bytes < size:
+            file.seek(bounds[-1] + shard_bytes)
+            file.readline()
+            if file.tell() >= size:
+                break
+            bounds.append(file.tell())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def has_multiline_fields(data):
+    # A line that opens a quoted field without closing it has an odd number
+    # of quotes, since escaped quotes inside a field are doubled.
+    return any(line.count('"') % 2 for line in data.split("\n"))
+
+
+def parse_range(path, start, end, columns=(0, 1, 2), sample_limit=0):
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start).decode("utf-8")
+
+    # Ranges are cut at newlines, which is only safe when no quoted field
+    # spans several lines.
+    if has_multiline_fields(data):
+        return {"end": end, "multiline": True}
+
+    contacts = {}
+    rows = invalid = duplicates = 0
+    samples = []
+    for row in csv.reader(io.StringIO(data, newline="")):
+        row = apply_columns(row, columns)
+        rows += 1
+        contact = normalize_row(row)
+        if contact is None:
+            invalid += 1
+            if len(samples) < sample_limit:
+                samples.append(error_sample(rows, row))
+        elif contact[0] in contacts:
+            duplicates += 1
+        else:
+            contacts[contact[0]] = contact
+    return {
+        "end": end,
+        "multiline": False,
+        "contacts": list(contacts.values()),
+        "rows": rows,
+        "invalid": invalid,
+        "duplicates": duplicates,
+        "samples": samples,
+    }
+
+
+def iter_shards(path, ranges, workers, columns=(0, 1, 2), sample_limit=0):
+    if workers <= 1:
+        for start, end in ranges:
+            yield parse_range(path, start, end, columns, sample_limit)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(
+                executor.submit(parse_range, path, start, end, columns, sample_limit)
+            )
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def contact_digest(email):
+    return hashlib.blake2b(email.encode(), digest_size=16).digest()
+
+
+def extend_samples(samples, new_samples, first_row, limit):
+    for sample in new_samples[: max(limit - len(samples), 0)]:
+        samples.append({**sample, "row": first_row + sample["row"] - 1})
+    return samples
+
+
+def merge_shards(shards, first_row, samples, sample_limit, seen=None):
+    # seen holds digests of the emails merged by earlier batches of the job,
+    # so repeats across batches count as duplicates too.
+    seen = set() if seen is None else seen
+    contacts = {}
+    summary = new_summary()
+    for shard in shards:
+        extend_samples(samples, shard["samples"], first_row, sample_limit)
+        for contact in shard["contacts"]:
+            digest = contact_digest(contact[0])
+            if digest in seen:
+                summary["duplicates"] += 1
+            else:
+                seen.add(digest)
+                contacts[contact[0]] = contact
+        first_row += shard["rows"]
+        summary["rows"] += shard["rows"]
+        summary["invalid"] += shard["invalid"]
+        summary["duplicates"] += shard["duplicates"]
+    return contacts, summary
+
+
+def discard_import_file(job):
+    # The spooled upload is only needed while the job can still resume.
+    if job.file:
+        job.file.storage.delete(job.file.name)
+
+
+def fail_import_job(job_id, error):
+    ImportJob.objects.filter(id=job_id).update(
+        status=ImportJob.STATUS_FAILED,
+        error=error,
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    job = ImportJob.objects.get(id=job_id)
+    discard_import_file(job)
+    return job
+
+
+def lock_import_job(job_id, rows_done):
+    job = ImportJob.objects.select_for_update().get(id=job_id)
+    # Another delivery of this job may already have moved past these rows.
+    return job if job.rows_done == rows_done else None
+
+
+def save_checkpoint(job, offset, summary, samples):
+    ImportJob.objects.filter(id=job.id).update(
+        byte_offset=offset,
+        rows_done=F("rows_done") + summary["rows"],
+        inserted=F("inserted") + summary["inserted"],
+        existing=F("existing") + summary["existing"],
+        invalid=F("invalid") + summary["invalid"],
+        duplicates=F("duplicates") + summary["duplicates"],
+        error_samples=samples,
+        updated_at=timezone.now(),
+    )
+
+
+def import_row_chunks(job, chunks):
+    rows_done = job.rows_done
+    for chunk, offset in chunks:
+        with transaction.atomic():
+            job = lock_import_job(job.id, rows_done)
+            if job is None:
+                return False
+
+            summary = import_rows(chunk, job.maillist, mode=job.mode)
+            samples = extend_samples(
+                job.error_samples,
+                summary["samples"],
+                job.rows_done + 1,
+                settings.IMPORT_ERROR_SAMPLES,
+            )
+            save_checkpoint(job, offset, summary, samples)
+        rows_done += summary["rows"]
+    return True
+
+
+def import_csv_file(job):
+    with job.file.open("rb") as file:
+        reader = CSVFileReader(file, job.byte_offset)
+        chunks = (
+            (chunk, reader.offset)
+            for chunk in chunked(reader, settings.IMPORT_CHUNK_SIZE)
+        )
+        return import_row_chunks(job, chunks)
+
+
+def import_spreadsheet_file(job):
+    # Spreadsheets cannot be seeked into, so a resumed job skips the rows it
+    # has already imported.
+    file_format = get_file_format(job.file.name)
+    with job.file.open("rb") as file:
+        if file_format == ".xlsx" and job.total_rows is None:
+            max_row = count_xlsx_rows(file)
+            file.seek(0)
+            if max_row:
+                job.total_rows = max_row - 1
+                ImportJob.objects.filter(id=job.id).update(total_rows=job.total_rows)
+        rows = iter_spreadsheet_rows(file, file_format)
+        columns = map_columns(next(rows, ()))
+        rows = (
+            apply_columns(row, columns) for row in islice(rows, job.rows_done, None)
+        )
+        chunks = ((chunk, 0) for chunk in chunked(rows, settings.IMPORT_CHUNK_SIZE))
+        return import_row_chunks(job, chunks)
+
+
+def import_csv_file_sharded(job):
+    path = job.file.path
+    with open(path, "rb") as file:
+        columns, header_size = read_csv_header(file)
+
+    sample_limit = settings.IMPORT_ERROR_SAMPLES
+    ranges = split_ranges(
+        path, max(job.byte_offset, header_size), settings.IMPORT_SHARD_BYTES
+    )
+    shards = iter_shards(path, ranges, job.workers, columns, sample_limit)
+    rows_done = job.rows_done
+    seen = set()
+    for batch in chunked(shards, job.workers):
+        if any(shard["multiline"] for shard in batch):
+            shards.close()
+            ImportJob.objects.filter(id=job.id).update(workers=1)
+            job = ImportJob.objects.select_related("maillist").get(id=job.id)
+            return import_csv_file(job)
+
+        with transaction.atomic():
+            job = lock_import_job(job.id, rows_done)
+            if job is None:
+                return False
+
+            samples = job.error_samples
+            contacts, summary = merge_shards(
+                batch, job.rows_done + 1, samples, sample_limit, seen
+            )
+            summary.update(store_contacts(contacts, job.maillist, job.mode))
+            save_checkpoint(job, batch[-1]["end"], summary, samples)
+        rows_done += summary["rows"]
+    return True
+
+
+def run_import_job(job_id):
+    job = ImportJob.objects.select_related("maillist").get(id=job_id)
+    if job.status in (ImportJob.STATUS_COMPLETED, ImportJob.STATUS_FAILED):
+        return job
+
+    ImportJob.objects.filter(id=job.id).update(
+        status=ImportJob.STATUS_RUNNING,
+        started_at=job.started_at or timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+    try:
+        if get_file_format(job.file.name) in SPREADSHEET_FORMATS:
+            finished = import_spreadsheet_file(job)
+        elif job.workers > 1:
+            finished = import_csv_file_sharded(job)
+        else:
+            finished = import_csv_file(job)
+    except IMPORT_FILE_ERRORS as e:
+        return fail_import_job(job.id, f"Error processing import file: {e}")
+
+    if finished:
+        ImportJob.objects.filter(id=job.id).update(
+            status=ImportJob.STATUS_COMPLETED,
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        discard_import_file(job)
+    return ImportJob.objects.get(id=job.id)
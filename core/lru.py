@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return self.sizeof(value) if self.sizeof else 0
+
+    def _is_full(self):
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            return True
+        if self.maxbytes is not None and self.bytes > self.maxbytes:
+            return True
+        return False
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._size(self._data[key])
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self.bytes += self._size(value)
+            while self._data and self._is_full():
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= self._size(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.bytes -= self._size(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
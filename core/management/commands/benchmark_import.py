@@ -0,0 +1,113 @@
+import csv
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.importers import (
+    CSVFileReader,
+    import_rows,
+    iter_shards,
+    read_csv_header,
+    split_ranges,
+)
+from core.models import MailList
+
+
+def synthetic_rows(count, prefix):
+    for i in range(count):
+        yield [f"{prefix}{i}@example.com", f"First{i}", f"Last{i}"]
+
+
+class Command(BaseCommand):
+    help = "Compare contact import throughput of the ORM and COPY paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "maillist",
+            type=int,
+            help="Each mode imports into a new list owned by this list's user",
+        )
+        parser.add_argument(
+            "--file", help="CSV file to import instead of generated rows"
+        )
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--modes", nargs="+", default=["orm", "copy"])
+        parser.add_argument(
+            "--keep", action="store_true", help="Commit the imported rows"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            default=[],
+            help="Also time sharded parsing with these process counts",
+        )
+
+    def benchmark_parse(self, path, workers):
+        with open(path, "rb") as file:
+            columns, start = read_csv_header(file)
+        ranges = split_ranges(path, start, settings.IMPORT_SHARD_BYTES)
+
+        baseline = None
+        for count in workers:
+            started = time.perf_counter()
+            rows = 0
+            for shard in iter_shards(path, ranges, count, columns):
+                if shard["multiline"]:
+                    raise CommandError("Quoted fields span lines, cannot shard file")
+                rows += shard["rows"]
+            elapsed = time.perf_counter() - started
+            baseline = baseline or elapsed
+            self.stdout.write(
+                f"parse with {count} workers: {rows} rows in {elapsed:.2f}s "
+                f"({rows / elapsed:.0f} rows/s, {baseline / elapsed:.1f}x)"
+            )
+
+    def handle(self, *args, **options):
+        maillist = MailList.objects.filter(id=options["maillist"]).first()
+        if maillist is None:
+            raise CommandError("Mail list does not exist")
+
+        if options["workers"]:
+            if options["file"]:
+                self.benchmark_parse(options["file"], options["workers"])
+            else:
+                with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+                    writer = csv.writer(file)
+                    writer.writerow(["email", "first_name", "last_name"])
+                    writer.writerows(synthetic_rows(options["rows"], "benchmark-"))
+                    file.flush()
+                    self.benchmark_parse(file.name, options["workers"])
+
+        for mode in options["modes"]:
+            if options["file"]:
+                file = open(options["file"], "rb")
+                rows = CSVFileReader(file)
+            else:
+                file = None
+                rows = synthetic_rows(options["rows"], f"benchmark-{time.time_ns()}-")
+
+            with transaction.atomic():
+                # A fresh list per mode, so a kept run does not leave members
+                # behind for the next mode to find.
+                target = MailList.objects.create(
+                    user_id=maillist.user_id, description=f"Benchmark {mode} import"
+                )
+                start = time.perf_counter()
+                summary = import_rows(rows, target, mode=mode)
+                elapsed = time.perf_counter() - start
+                if not options["keep"]:
+                    transaction.set_rollback(True)
+            if file is not None:
+                file.close()
+
+            rate = summary["rows"] / elapsed if elapsed else 0
+            self.stdout.write(
+                f"{mode}: {summary['rows']} rows into list {target.id} in "
+                f"{elapsed:.2f}s ({rate:.0f} rows/s) inserted={summary['inserted']} "
+                f"existing={summary['existing']} invalid={summary['invalid']} "
+                f"duplicates={summary['duplicates']}"
+            )
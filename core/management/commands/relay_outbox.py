@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.outbox import purge, relay
+
+
+class Command(BaseCommand):
+    help = "Publish pending outbox messages to the Celery broker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.OUTBOX_RELAY_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--interval", type=float, default=settings.OUTBOX_RELAY_INTERVAL
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the outbox once and exit"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        retention = timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+
+        while True:
+            relayed = relay(batch_size)
+            if relayed:
+                self.stdout.write(f"Relayed {relayed} outbox messages")
+            if relayed < batch_size:
+                purge(timezone.now() - retention)
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.caching import RESOURCES, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show response cache hits and misses per resource"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters after printing"
+        )
+
+    def handle(self, *args, **options):
+        for resource, stats in get_stats(RESOURCES).items():
+            total = stats["hits"] + stats["misses"]
+            ratio = stats["hits"] / total if total else 0
+            self.stdout.write(
+                f"{resource}: {stats['hits']} hits, {stats['misses']} misses "
+                f"({ratio:.1%} hit rate)"
+            )
+        if options["reset"]:
+            reset_stats(RESOURCES)
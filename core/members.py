@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from django.db import connection
+
+from .caching import invalidate_responses
+from .models import EmailMailList, MailList
+
+MAILLIST_TABLE = MailList._meta.db_table
+MEMBER_TABLE = EmailMailList._meta.db_table
+
+RECONCILE_SQL = f"""
+    UPDATE {MAILLIST_TABLE} m
+    SET active_count = actual.active_count,
+        unsubscribed_count = actual.unsubscribed_count
+    FROM (
+        SELECT
+            ml.id,
+            count(eml.id) FILTER (WHERE eml.unsubscribed_at IS NULL) AS active_count,
+            count(eml.id) FILTER (WHERE eml.unsubscribed_at IS NOT NULL)
+                AS unsubscribed_count
+        FROM {MAILLIST_TABLE} ml
+        LEFT JOIN {MEMBER_TABLE} eml ON eml.maillist_id = ml.id
+        GROUP BY ml.id
+    ) actual
+    WHERE m.id = actual.id
+        AND (
+            m.active_count <> actual.active_count
+            OR m.unsubscribed_count <> actual.unsubscribed_count
+        )
+    RETURNING m.user_id
+"""
+
+
+ADJUST_SQL = f"""
+    UPDATE {MAILLIST_TABLE} m
+    SET active_count = m.active_count + delta.active_count,
+        unsubscribed_count = m.unsubscribed_count + delta.unsubscribed_count
+    FROM unnest(%s::bigint[], %s::integer[], %s::integer[])
+        AS delta(id, active_count, unsubscribed_count)
+    WHERE m.id = delta.id
+    RETURNING m.user_id
+"""
+
+
+def count_field(unsubscribed_at):
+    return "active_count" if unsubscribed_at is None else "unsubscribed_count"
+
+
+def member_deltas(rows, sign=1, deltas=None):
+    deltas = deltas if deltas is not None else defaultdict(lambda: defaultdict(int))
+    for maillist_id, unsubscribed_at in rows:
+        deltas[maillist_id][count_field(unsubscribed_at)] += sign
+    return deltas
+
+
+def adjust_member_counts(deltas):
+    rows = [
+        (
+            maillist_id,
+            fields.get("active_count", 0),
+            fields.get("unsubscribed_count", 0),
+        )
+        for maillist_id, fields in deltas.items()
+    ]
+    rows = [row for row in rows if row[1] or row[2]]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(ADJUST_SQL, [list(column) for column in zip(*rows)])
+        invalidate_responses("maillists", [row[0] for row in cursor.fetchall()])
+
+
+def count_added_members(maillist_id, count):
+    # Bulk imports only ever link active members.
+    adjust_member_counts({maillist_id: {"active_count": count}})
+
+
+def count_removed_members(rows):
+    adjust_member_counts(member_deltas(rows, -1))
+
+
+def count_changed_member(previous, current):
+    # previous is None for a new membership.
+    if previous is None:
+        adjust_member_counts(member_deltas([current]))
+    elif (previous[0], previous[1] is None) != (current[0], current[1] is None):
+        adjust_member_counts(member_deltas([current], 1, member_deltas([previous], -1)))
+
+
+def reconcile_member_counts():
+    with connection.cursor() as cursor:
+        cursor.execute(RECONCILE_SQL)
+        invalidate_responses("maillists", [row[0] for row in cursor.fetchall()])
+        return cursor.rowcount
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignStats',
+            fields=[
+                ('campaign', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.campaign')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('queued', models.PositiveIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
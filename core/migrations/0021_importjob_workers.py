@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='workers',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_importjob_workers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='campaign_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['created_at', 'id'], name='email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmaillist',
+            index=models.Index(fields=['created_at', 'id'], name='emailmaillist_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailtemplate',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='emailtemplate_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='importjob_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maillist',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='maillist_user_created_idx'),
+        ),
+    ]
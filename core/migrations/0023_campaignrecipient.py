@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='audience_frozen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='recipient_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CampaignRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='core.campaign')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_recipients', to='core.email')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='campaignrecipient',
+            constraint=models.UniqueConstraint(fields=('campaign', 'email'), name='campaign_recipient_unique'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+# Intentionally a frozen copy of core.members.RECONCILE_SQL: migrations must
+# keep running the SQL they shipped with, whatever the app code becomes.
+BACKFILL_COUNTS = """
+    UPDATE core_maillist m
+    SET active_count = actual.active_count,
+        unsubscribed_count = actual.unsubscribed_count
+    FROM (
+        SELECT
+            ml.id,
+            count(eml.id) FILTER (WHERE eml.unsubscribed_at IS NULL) AS active_count,
+            count(eml.id) FILTER (WHERE eml.unsubscribed_at IS NOT NULL) AS unsubscribed_count
+        FROM core_maillist ml
+        LEFT JOIN core_emailmaillist eml ON eml.maillist_id = ml.id
+        GROUP BY ml.id
+    ) actual
+    WHERE m.id = actual.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_campaignrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maillist',
+            name='active_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='maillist',
+            name='unsubscribed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:21
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0024_maillist_member_counts'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='emailmaillist',
+            index=models.Index(condition=models.Q(('unsubscribed_at__isnull', True)), fields=['maillist'], name='emailmaillist_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='outgoingmails',
+            index=models.Index(fields=['campaign', 'status'], name='outgoing_campaign_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='outgoingmails',
+            index=models.Index(fields=['user', 'status'], name='outgoing_user_status_idx'),
+        ),
+        migrations.AlterField(
+            model_name='outgoingmails',
+            name='campaign',
+            field=models.ForeignKey(db_index=False, default=None, on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_mails', to='core.campaign'),
+        ),
+        migrations.AlterField(
+            model_name='outgoingmails',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
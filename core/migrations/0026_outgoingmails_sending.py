@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:50
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0025_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outgoingmails',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=10),
+        ),
+        AddIndexConcurrently(
+            model_name='outgoingmails',
+            index=models.Index(condition=models.Q(('status', 'sending')), fields=['updated_at'], name='outgoing_sending_idx'),
+        ),
+    ]
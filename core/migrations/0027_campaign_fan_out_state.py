@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_outgoingmails_sending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='fan_out_task_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='fan_out_email_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
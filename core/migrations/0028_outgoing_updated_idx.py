@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0027_campaign_fan_out_state'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='outgoingmails',
+            index=models.Index(fields=['updated_at', 'campaign'], name='outgoing_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_outgoing_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='total_rows',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
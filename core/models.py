@@ -1,5 +1,7 @@
+import uuid
+
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core import validators
 from django.core.exceptions import ValidationError
@@ -13,15 +15,24 @@ class MailList(models.Model):
     description = models.CharField(max_length=255, blank=True, null=True)
     category = models.CharField(max_length=255, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    active_count = models.IntegerField(default=0)
+    unsubscribed_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "id"], name="maillist_user_created_idx"
+            )
+        ]
+
     def mark_inactive(self):
         self.is_active = False
         self.save(update_fields=["is_active", "updated_at"])
 
     def __str__(self):
-        return self.name
+        return self.description or f"Mail list {self.id}"
 
 
 class Email(models.Model):
@@ -31,6 +42,9 @@ class Email(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"], name="email_created_idx")]
+
     def __str__(self):
         return self.email
 
@@ -43,13 +57,30 @@ class EmailMailList(models.Model):
 
     class Meta:
         unique_together = ("email", "maillist")
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="emailmaillist_created_idx"),
+            models.Index(
+                fields=["maillist"],
+                condition=models.Q(unsubscribed_at__isnull=True),
+                name="emailmaillist_active_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def unsubscribe(self):
-        self.unsubscribed_at = timezone.now()
-        self.save(update_fields=["unsubscribed_at"])
+        # The post_save receiver prunes campaign recipients in the same
+        # transaction.
+        with transaction.atomic():
+            self.unsubscribed_at = timezone.now()
+            self.save(update_fields=["unsubscribed_at"])
 
     def __str__(self):
-        return f"{self.email.email} in {self.maillist.name}"
+        return f"{self.email.email} in {self.maillist}"
 
 
 class EmailTemplate(models.Model):
@@ -68,6 +99,12 @@ class EmailTemplate(models.Model):
     class Meta:
         verbose_name = "Email Template"
         verbose_name_plural = "Email Templates"
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "id"],
+                name="emailtemplate_user_created_idx",
+            )
+        ]
 
 
 class Campaign(models.Model):
@@ -93,9 +130,20 @@ class Campaign(models.Model):
     template = models.ForeignKey(
         "EmailTemplate", on_delete=models.SET_NULL, null=True, blank=True
     )
+    audience_frozen_at = models.DateTimeField(blank=True, null=True)
+    recipient_count = models.PositiveIntegerField(default=0)
+    fan_out_task_id = models.CharField(max_length=255, blank=True, default="")
+    fan_out_email_id = models.BigIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "id"], name="campaign_user_created_idx"
+            )
+        ]
+
     def __str__(self):
         return self.name
 
@@ -107,16 +155,18 @@ class Campaign(models.Model):
         self.status = self.STATUS_INACTIVE
         self.save(update_fields=["status", "updated_at"])
 
-    def get_all_emails(self):
-        return (
-            Email.objects.filter(
-                emailmaillist__maillist__campaigns=self,
-                emailmaillist__unsubscribed_at__isnull=True,
-            )
-            .distinct()
-            .values_list("email", flat=True)
+    def get_audience(self):
+        if self.audience_frozen_at:
+            return Email.objects.filter(campaign_recipients__campaign=self)
+        return Email.objects.filter(
+            id__in=EmailMailList.objects.filter(
+                maillist__campaigns=self, unsubscribed_at__isnull=True
+            ).values("email_id")
         )
 
+    def get_all_emails(self):
+        return self.get_audience().values_list("email", flat=True)
+
     def get_attachments(self):
         attachments_list = list(self.attachments.all())
         return attachments_list
@@ -126,6 +176,26 @@ class Campaign(models.Model):
         super().save(*args, **kwargs)
 
 
+class CampaignRecipient(models.Model):
+    campaign = models.ForeignKey(
+        Campaign, on_delete=models.CASCADE, related_name="recipients"
+    )
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE, related_name="campaign_recipients"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["campaign", "email"], name="campaign_recipient_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.email_id} in {self.campaign_id}"
+
+
 class Attachment(models.Model):
     name = models.CharField(max_length=255, blank=True, null=True, default="")
     file = models.FileField(
@@ -149,14 +219,20 @@ class Attachment(models.Model):
 class OutgoingMails(models.Model):
     STATUS_CHOICES = [
         ("queued", "Queued"),
+        ("sending", "Sending"),
         ("sent", "Sent"),
         ("failed", "Failed"),
     ]
 
+    # Covered by the (campaign, status) and (user, status) indexes below.
     campaign = models.ForeignKey(
-        Campaign, on_delete=models.CASCADE, related_name="outgoing_mails", default=None
+        Campaign,
+        on_delete=models.CASCADE,
+        related_name="outgoing_mails",
+        default=None,
+        db_index=False,
     )
-    user = models.ForeignKey(USER_MODEL, on_delete=models.CASCADE)
+    user = models.ForeignKey(USER_MODEL, on_delete=models.CASCADE, db_index=False)
     sender = models.CharField(max_length=255)
     to = models.CharField(max_length=255)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
@@ -166,6 +242,22 @@ class OutgoingMails(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["campaign", "status"], name="outgoing_campaign_status_idx"
+            ),
+            models.Index(fields=["user", "status"], name="outgoing_user_status_idx"),
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(status="sending"),
+                name="outgoing_sending_idx",
+            ),
+            models.Index(
+                fields=["updated_at", "campaign"], name="outgoing_updated_idx"
+            ),
+        ]
+
     def get_attachments(self):
         return list(self.custom_attachments.all()) + list(
             self.campaign.attachments.all()
@@ -175,6 +267,102 @@ class OutgoingMails(models.Model):
         return f"{self.sender} to {self.to}"
 
 
+class CampaignStats(models.Model):
+    campaign = models.OneToOneField(
+        Campaign, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    total = models.PositiveIntegerField(default=0)
+    queued = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.campaign_id}"
+
+
+class ImportJob(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    MODE_CHOICES = [
+        ("orm", "ORM"),
+        ("copy", "COPY"),
+    ]
+
+    user = models.ForeignKey(
+        USER_MODEL, on_delete=models.CASCADE, related_name="import_jobs"
+    )
+    maillist = models.ForeignKey(
+        MailList, on_delete=models.CASCADE, related_name="import_jobs"
+    )
+    file = models.FileField(upload_to="imports")
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default="copy")
+    workers = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    total_bytes = models.BigIntegerField(default=0)
+    byte_offset = models.BigIntegerField(default=0)
+    # Data rows in the first sheet of an xlsx file, read from its dimension.
+    # Null for CSV, which is tracked in bytes, and for ODS, which would have
+    # to be parsed in full to count its rows.
+    total_rows = models.BigIntegerField(blank=True, null=True)
+    rows_done = models.BigIntegerField(default=0)
+    inserted = models.BigIntegerField(default=0)
+    existing = models.BigIntegerField(default=0)
+    invalid = models.BigIntegerField(default=0)
+    duplicates = models.BigIntegerField(default=0)
+    error_samples = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "id"], name="importjob_user_created_idx"
+            )
+        ]
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.rows_done / elapsed if elapsed else 0
+
+    @property
+    def eta(self):
+        if self.status != self.STATUS_RUNNING:
+            return None
+        if self.byte_offset:
+            remaining = max(self.total_bytes - self.byte_offset, 0)
+            return remaining * self.elapsed / self.byte_offset
+        if self.total_rows and self.rows_done:
+            remaining = max(self.total_rows - self.rows_done, 0)
+            return remaining * self.elapsed / self.rows_done
+        return None
+
+    def __str__(self):
+        return f"Import {self.id} into {self.maillist_id}"
+
+
 class ColdMailing(models.Model):
     user = models.ForeignKey(USER_MODEL, on_delete=models.CASCADE)
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE)
@@ -184,3 +372,23 @@ class ColdMailing(models.Model):
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} from {self.company}"
+
+
+class OutboxMessage(models.Model):
+    task_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    task_name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    relayed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(relayed_at__isnull=True),
+                name="outbox_pending_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} {self.task_id}"
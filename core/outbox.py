@@ -0,0 +1,44 @@
+from celery import current_app
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+def enqueue(task, *args):
+    return OutboxMessage.objects.create(task_name=task.name, args=list(args))
+
+
+def enqueue_many(task, args_list):
+    return OutboxMessage.objects.bulk_create(
+        OutboxMessage(task_name=task.name, args=list(args)) for args in args_list
+    )
+
+
+def relay(batch_size):
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(relayed_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not messages:
+            return 0
+
+        with current_app.producer_or_acquire() as producer:
+            for message in messages:
+                current_app.send_task(
+                    message.task_name,
+                    args=message.args,
+                    task_id=str(message.task_id),
+                    producer=producer,
+                )
+
+        OutboxMessage.objects.filter(
+            id__in=[message.id for message in messages]
+        ).update(relayed_at=timezone.now())
+    return len(messages)
+
+
+def purge(before):
+    return OutboxMessage.objects.filter(relayed_at__lt=before).delete()[0]
@@ -6,6 +6,9 @@ class HasCompleteProfile(permissions.BasePermission):
     message = "You need to set up your SMTP credentials before performing this action."
 
     def has_permission(self, request, view):
-        if not hasattr(request.user, "smtp_creds"):
+        has_smtp_creds = getattr(request.user, "has_smtp_creds", None)
+        if has_smtp_creds is None:
+            has_smtp_creds = hasattr(request.user, "smtp_creds")
+        if not has_smtp_creds:
             raise PermissionDenied(detail=self.message)
         return True
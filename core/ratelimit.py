@@ -0,0 +1,129 @@
+import uuid
+
+import redis
+from django.conf import settings
+
+# Refills every bucket in KEYS from the elapsed server time, then takes one
+# token from each of them only if all of them have one. Returns "0" when the
+# tokens were taken, or the number of seconds until they will be available.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local wait = 0
+local tokens = {}
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local available = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    available = math.min(burst, available + math.max(0, now - ts) * rate)
+    if available < 1 then
+        wait = math.max(wait, (1 - available) / rate)
+    end
+    tokens[i] = available
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call("HSET", key, "tokens", tokens[i] - 1, "ts", now)
+    redis.call("EXPIRE", key, math.ceil(burst / rate) + 1)
+end
+return "0"
+"""
+
+
+class RateLimiter:
+    def __init__(self, client=None):
+        self.client = client or redis.Redis.from_url(settings.CELERY_BROKER_URL)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def get_limits(self, smtp_creds):
+        host_rate, host_burst = settings.SMTP_HOST_RATE_LIMITS.get(
+            smtp_creds.host, (settings.SMTP_HOST_RATE, settings.SMTP_HOST_BURST)
+        )
+        return [
+            (
+                f"smtp-rate:account:{smtp_creds.id}",
+                smtp_creds.send_rate or settings.SMTP_ACCOUNT_RATE,
+                smtp_creds.send_burst or settings.SMTP_ACCOUNT_BURST,
+            ),
+            (f"smtp-rate:host:{smtp_creds.host}", host_rate, host_burst),
+        ]
+
+    def acquire(self, smtp_creds):
+        if not settings.SMTP_RATE_LIMIT_ENABLED:
+            return 0
+
+        limits = self.get_limits(smtp_creds)
+        keys = [key for key, _, _ in limits]
+        args = [value for _, rate, burst in limits for value in (rate, burst)]
+        return float(self.script(keys=keys, args=args))
+
+
+limiter = RateLimiter()
+
+
+# Drops expired holders from every set in KEYS, then adds ARGV[1] to each of
+# them only if all of them are below their limit. Holders expire after the
+# lease so slots taken by a crashed worker are eventually given back.
+# Returns 1 when the slots were taken and 0 otherwise.
+ACQUIRE_SLOTS_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local lease = tonumber(ARGV[2])
+
+for i, key in ipairs(KEYS) do
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", now)
+    if redis.call("ZCARD", key) >= tonumber(ARGV[i + 2]) then
+        return 0
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    redis.call("ZADD", key, now + lease, ARGV[1])
+    redis.call("EXPIRE", key, math.ceil(lease) + 1)
+end
+return 1
+"""
+
+
+class ConcurrencyLimiter:
+    def __init__(self, client=None):
+        self.client = client or redis.Redis.from_url(settings.CELERY_BROKER_URL)
+        self.script = self.client.register_script(ACQUIRE_SLOTS_SCRIPT)
+
+    def get_limits(self, smtp_creds):
+        return [
+            (
+                f"smtp-slots:account:{smtp_creds.id}",
+                settings.ASYNC_DELIVERY_ACCOUNT_CONCURRENCY,
+            ),
+            (
+                f"smtp-slots:host:{smtp_creds.host}",
+                settings.ASYNC_DELIVERY_HOST_CONCURRENCY,
+            ),
+        ]
+
+    def acquire(self, smtp_creds):
+        limits = self.get_limits(smtp_creds)
+        token = uuid.uuid4().hex
+        args = [token, settings.ASYNC_DELIVERY_SLOT_LEASE]
+        args.extend(limit for _, limit in limits)
+        taken = self.script(keys=[key for key, _ in limits], args=args)
+        return token if int(taken) else None
+
+    def release(self, smtp_creds, token):
+        pipe = self.client.pipeline()
+        for key, _ in self.get_limits(smtp_creds):
+            pipe.zrem(key, token)
+        pipe.execute()
+
+
+slots = ConcurrencyLimiter()
@@ -1,9 +1,8 @@
-import csv
-
-from django.db import transaction
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
 from rest_framework import serializers
+from .importers import IMPORT_FORMATS, get_file_format, get_import_workers
 from .models import (
     Email,
     MailList,
@@ -12,6 +11,7 @@ from .models import (
     EmailMailList,
     EmailTemplate,
     Attachment,
+    ImportJob,
 )
 
 USER_MODEL = get_user_model()
@@ -36,60 +36,52 @@ class BulkAddEmailSerializer(serializers.Serializer):
     maillist = serializers.PrimaryKeyRelatedField(queryset=MailList.objects.all())
 
     def validate_csv_file(self, value):
-        if not value.name.endswith(".csv"):
+        if get_file_format(value.name) not in IMPORT_FORMATS:
             raise serializers.ValidationError("Invalid file type")
-
-        try:
-            decoded_file = value.read().decode("utf-8").splitlines()
-            reader = csv.reader(decoded_file)
-            next(reader)
-
-            invalid_emails = []
-
-            for row in reader:
-                email = row[0].strip()
-                if "@" not in email:
-                    invalid_emails.append(email)
-
-            if invalid_emails:
-                raise serializers.ValidationError(
-                    f"Invalid emails found: {', '.join(invalid_emails)}"
-                )
-        except Exception as e:
-            raise serializers.ValidationError(f"Error reading CSV file: {e}")
-
         return value
 
     def create(self, validated_data):
         csv_file = validated_data.get("csv_file")
-        maillist = validated_data.get("maillist")
-        emails_to_create = []
-        email_maillist_to_create = []
-
-        try:
-            decoded_file = csv_file.read().decode("utf-8").splitlines()
-            reader = csv.reader(decoded_file)
-            next(reader)
-
-            with transaction.atomic():
-                for row in reader:
-                    email_str = row[0].strip()
-                    if "@" in email_str:
-                        email, created = Email.objects.get_or_create(email=email_str)
-                        if created:
-                            emails_to_create.append(email)
-                            email_maillist_to_create.append(
-                                EmailMailList(email=email, maillist=maillist)
-                            )
-
-                Email.objects.bulk_create(emails_to_create, ignore_conflicts=True)
-                EmailMailList.objects.bulk_create(
-                    email_maillist_to_create, ignore_conflicts=True
-                )
-
-                return {"success": "Emails added to the mail list"}
-        except Exception as e:
-            raise serializers.ValidationError(f"Error processing CSV file: {e}")
+        return ImportJob.objects.create(
+            user=validated_data.get("user"),
+            maillist=validated_data.get("maillist"),
+            file=csv_file,
+            total_bytes=csv_file.size,
+            mode=settings.EMAIL_IMPORT_MODE,
+            workers=get_import_workers(csv_file.size, csv_file.name),
+        )
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.FloatField(read_only=True)
+    eta = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            "id",
+            "maillist",
+            "mode",
+            "workers",
+            "status",
+            "total_bytes",
+            "byte_offset",
+            "total_rows",
+            "rows_done",
+            "inserted",
+            "existing",
+            "invalid",
+            "duplicates",
+            "rows_per_second",
+            "eta",
+            "error_samples",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
 
 
 class MailListSerializer(serializers.ModelSerializer):
@@ -99,14 +91,22 @@ class MailListSerializer(serializers.ModelSerializer):
         fields = [
             "id",
             "user",
-            "name",
             "description",
             "category",
             "is_active",
+            "active_count",
+            "unsubscribed_count",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["created_at", "updated_at", "id", "user"]
+        read_only_fields = [
+            "created_at",
+            "updated_at",
+            "id",
+            "user",
+            "active_count",
+            "unsubscribed_count",
+        ]
 
 
 class EmailMailListSerializer(serializers.ModelSerializer):
@@ -125,6 +125,9 @@ class EmailMailListSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at", "id"]
 
     def validate(self, attrs):
+        if self.instance is not None:
+            attrs.setdefault("email", self.instance.email.email)
+            attrs.setdefault("maillist", self.instance.maillist)
         email = attrs.get("email")
         maillist = attrs.get("maillist")
         request = self.context.get("request")
@@ -132,24 +135,28 @@ class EmailMailListSerializer(serializers.ModelSerializer):
         if not request:
             raise serializers.ValidationError("Request context is required.")
 
-        if not Email.objects.filter(email=email).exists():
-            raise serializers.ValidationError("Email does not exist.")
-
-        if not MailList.objects.filter(id=maillist.id, user=request.user).exists():
+        if maillist.user_id != request.user.id:
             raise serializers.ValidationError(
                 "Mail list does not exist or you do not have access to it."
             )
 
-        if EmailMailList.objects.filter(email__email=email, maillist=maillist).exists():
+        email = Email.objects.filter(email=email).first()
+        if email is None:
+            raise serializers.ValidationError("Email does not exist.")
+
+        members = EmailMailList.objects.filter(email=email, maillist=maillist)
+        if self.instance is not None:
+            members = members.exclude(id=self.instance.id)
+        if members.exists():
             raise serializers.ValidationError("Email already exists in this mail list.")
 
+        attrs["email"] = email
         return attrs
 
     def create(self, validated_data):
-        email_str = validated_data.get("email")
+        email = validated_data.get("email")
         maillist = validated_data.get("maillist")
 
-        email = Email.objects.get(email=email_str)
         email_maillist = EmailMailList.objects.create(email=email, maillist=maillist)
 
         return email_maillist
@@ -199,10 +206,17 @@ class CampaignSerializer(serializers.ModelSerializer):
             "status",
             "template",
             "attachments",
+            "audience_frozen_at",
+            "recipient_count",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = [
+            "audience_frozen_at",
+            "recipient_count",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["created_at", "updated_at"]
 
 
 class OutgoingMailSerializer(serializers.ModelSerializer):
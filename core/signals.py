@@ -0,0 +1,132 @@
+import redis
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .audience import add_recipients, prune_recipients, sync_recipients
+from .caching import invalidate_responses
+from .members import count_changed_member
+from .models import (
+    Attachment,
+    Campaign,
+    EmailMailList,
+    EmailTemplate,
+    MailList,
+)
+from .stats import counters
+
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def touch_attachment_campaign(sender, instance, origin=None, **kwargs):
+    if instance.campaign_id and not isinstance(origin, Campaign):
+        campaigns = Campaign.objects.filter(id=instance.campaign_id)
+        invalidate_responses("campaigns", campaigns.values_list("user_id", flat=True))
+        campaigns.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=EmailTemplate)
+@receiver(post_delete, sender=EmailTemplate)
+def invalidate_template_responses(sender, instance, **kwargs):
+    invalidate_responses("templates", [instance.user_id])
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+def invalidate_campaign_responses(sender, instance, **kwargs):
+    invalidate_responses("campaigns", [instance.user_id])
+
+
+@receiver(post_save, sender=MailList)
+@receiver(post_delete, sender=MailList)
+def invalidate_maillist_responses(sender, instance, **kwargs):
+    invalidate_responses("maillists", [instance.user_id])
+
+
+def discard_campaign_counters(campaign_id):
+    # A hash left behind is removed by the next fold, which skips deleted
+    # campaigns.
+    try:
+        counters.clear(campaign_id)
+    except redis.RedisError:
+        pass
+
+
+@receiver(post_delete, sender=Campaign)
+def clear_campaign_counters(sender, instance, **kwargs):
+    campaign_id = instance.id
+    transaction.on_commit(lambda: discard_campaign_counters(campaign_id))
+
+
+@receiver(m2m_changed, sender=Campaign.maillists.through)
+def refresh_campaign_recipients(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        instance._cleared_campaign_ids = list(
+            instance.campaigns.values_list("id", flat=True)
+        )
+        return
+
+    if reverse:
+        campaign_ids = pk_set
+        if action == "post_clear":
+            campaign_ids = getattr(instance, "_cleared_campaign_ids", [])
+        maillist_ids = [instance.id]
+    else:
+        campaign_ids = [instance.id]
+        maillist_ids = pk_set
+
+    if action == "post_add":
+        add_recipients(campaign_ids=campaign_ids, maillist_ids=maillist_ids)
+    elif action in ("post_remove", "post_clear") and campaign_ids:
+        prune_recipients(campaign_ids=campaign_ids)
+
+    if action in ("post_add", "post_remove", "post_clear") and campaign_ids:
+        campaigns = Campaign.objects.filter(id__in=campaign_ids)
+        invalidate_responses("campaigns", campaigns.values_list("user_id", flat=True))
+        campaigns.update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=MailList)
+def remember_maillist_campaigns(sender, instance, **kwargs):
+    instance._campaigns = list(instance.campaigns.values_list("id", "user_id"))
+
+
+@receiver(post_delete, sender=MailList)
+def prune_maillist_recipients(sender, instance, **kwargs):
+    campaigns = getattr(instance, "_campaigns", None)
+    if campaigns:
+        prune_recipients(campaign_ids=[campaign_id for campaign_id, _ in campaigns])
+        invalidate_responses("campaigns", [user_id for _, user_id in campaigns])
+
+
+@receiver(post_save, sender=EmailMailList)
+def track_member_changes(sender, instance, created, **kwargs):
+    loaded = getattr(instance, "_loaded_values", {})
+    current = (instance.maillist_id, instance.unsubscribed_at)
+    instance._loaded_values = {
+        "email_id": instance.email_id,
+        "maillist_id": instance.maillist_id,
+        "unsubscribed_at": instance.unsubscribed_at,
+    }
+
+    if created:
+        count_changed_member(None, current)
+        add_recipients(
+            maillist_ids=[instance.maillist_id], email_ids=[instance.email_id]
+        )
+        return
+
+    # Rows saved without loading these fields cannot be compared, the
+    # reconcile task repairs their counts.
+    if not all(field in loaded for field in instance._loaded_values):
+        return
+
+    count_changed_member((loaded["maillist_id"], loaded["unsubscribed_at"]), current)
+    previous = (loaded["email_id"], loaded["maillist_id"], loaded["unsubscribed_at"])
+    if previous != (instance.email_id, *current):
+        # Only saves that change the membership touch the audience.
+        sync_recipients(
+            {loaded["maillist_id"], instance.maillist_id},
+            {loaded["email_id"], instance.email_id},
+        )
@@ -0,0 +1,143 @@
+import smtplib
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def pool_key(smtp_creds):
+    # Saving the credentials bumps updated_at, so connections authenticated
+    # with a rotated password are never handed out again.
+    return (
+        smtp_creds.id,
+        smtp_creds.updated_at,
+        smtp_creds.host,
+        smtp_creds.port,
+        smtp_creds.username,
+        smtp_creds.use_tls,
+        smtp_creds.use_ssl,
+    )
+
+
+class PooledConnection:
+    def __init__(self, key, smtp_creds):
+        self.key = key
+        self.backend = EmailBackend(
+            host=smtp_creds.host,
+            port=smtp_creds.port,
+            username=smtp_creds.username,
+            password=smtp_creds.password,
+            use_tls=smtp_creds.use_tls,
+            use_ssl=smtp_creds.use_ssl,
+            fail_silently=False,
+        )
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def open(self):
+        self.backend.close()
+        self.backend.open()
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception:
+            pass
+
+    def is_alive(self):
+        if self.backend.connection is None:
+            return False
+        try:
+            return self.backend.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _with_reconnect(self, send):
+        try:
+            sent = send()
+        except DISCONNECT_ERRORS:
+            self.open()
+            sent = send()
+        self.sent += sent or 0
+        self.last_used = time.monotonic()
+        return sent
+
+    def send_messages(self, messages):
+        return self._with_reconnect(lambda: self.backend.send_messages(messages))
+
+    def sendmail(self, message):
+        def send():
+            self.backend.connection.sendmail(
+                message.from_email, message.recipients, message.data
+            )
+            return 1
+
+        return self._with_reconnect(send)
+
+
+class SMTPConnectionPool:
+    def __init__(self, idle_timeout=None, max_messages=None):
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _is_expired(self, conn):
+        if self.max_messages and conn.sent >= self.max_messages:
+            return True
+        if self.idle_timeout and time.monotonic() - conn.last_used > self.idle_timeout:
+            return True
+        return False
+
+    def acquire(self, smtp_creds):
+        key = pool_key(smtp_creds)
+        while True:
+            with self._lock:
+                conn = self._idle[key].pop() if self._idle[key] else None
+            if conn is None:
+                break
+            if not self._is_expired(conn) and conn.is_alive():
+                return conn
+            conn.close()
+
+        conn = PooledConnection(key, smtp_creds)
+        conn.open()
+        return conn
+
+    def release(self, conn):
+        if self._is_expired(conn):
+            conn.close()
+            return
+        with self._lock:
+            self._idle[conn.key].append(conn)
+
+    @contextmanager
+    def connection(self, smtp_creds):
+        conn = self.acquire(smtp_creds)
+        try:
+            yield conn
+        except DISCONNECT_ERRORS:
+            conn.close()
+            raise
+        except Exception:
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            connections = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
+
+
+pool = SMTPConnectionPool(
+    idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT,
+    max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+)
@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Campaign, CampaignStats, OutgoingMails
+
+STATS_KEY = "campaign-stats:{}"
+DIRTY_KEY = "campaign-stats:dirty"
+FIELDS = ("total", "queued", "sent", "failed")
+
+
+class CampaignCounters:
+    def __init__(self, client=None):
+        self.client = client or redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+    def seed(self, campaign_ids):
+        pipe = self.client.pipeline(transaction=False)
+        for campaign_id in campaign_ids:
+            pipe.exists(STATS_KEY.format(campaign_id))
+        missing = [
+            campaign_id
+            for campaign_id, exists in zip(campaign_ids, pipe.execute())
+            if not exists
+        ]
+        if not missing:
+            return
+
+        folded = CampaignStats.objects.filter(campaign_id__in=missing).in_bulk()
+        pipe = self.client.pipeline(transaction=False)
+        for campaign_id in missing:
+            stats = folded.get(campaign_id)
+            for field in FIELDS:
+                value = getattr(stats, field, 0)
+                pipe.hsetnx(STATS_KEY.format(campaign_id), field, value)
+        pipe.execute()
+
+    def incr(self, deltas):
+        if not deltas:
+            return
+
+        self.seed(list(deltas))
+        pipe = self.client.pipeline(transaction=False)
+        for campaign_id, fields in deltas.items():
+            for field, delta in fields.items():
+                if delta:
+                    pipe.hincrby(STATS_KEY.format(campaign_id), field, delta)
+            pipe.sadd(DIRTY_KEY, campaign_id)
+        pipe.execute()
+
+    def get(self, campaign_id):
+        values = self.client.hgetall(STATS_KEY.format(campaign_id))
+        if not values:
+            return None
+        return {field: int(values.get(field.encode(), 0)) for field in FIELDS}
+
+    def clear(self, campaign_id):
+        self.client.delete(STATS_KEY.format(campaign_id))
+        self.client.srem(DIRTY_KEY, campaign_id)
+
+    def fold(self):
+        folded = 0
+        while campaign_ids := self.client.spop(DIRTY_KEY, 100):
+            campaign_ids = [int(campaign_id) for campaign_id in campaign_ids]
+            existing = set(
+                Campaign.objects.filter(id__in=campaign_ids).values_list(
+                    "id", flat=True
+                )
+            )
+            for campaign_id in campaign_ids:
+                if campaign_id not in existing:
+                    self.client.delete(STATS_KEY.format(campaign_id))
+                    continue
+                values = self.get(campaign_id)
+                if values is None:
+                    continue
+                CampaignStats.objects.update_or_create(
+                    campaign_id=campaign_id, defaults=values
+                )
+                folded += 1
+        return folded
+
+    def reconcile(self, campaign_ids=None):
+        # Recounts from OutgoingMails and overwrites the hashes. Callers hold
+        # the status flush lock, so no flushed delta lands between the two.
+        if campaign_ids is None:
+            campaign_ids = recent_campaign_ids()
+        if not campaign_ids:
+            return 0
+
+        values = {campaign_id: dict.fromkeys(FIELDS, 0) for campaign_id in campaign_ids}
+        rows = (
+            OutgoingMails.objects.filter(campaign_id__in=campaign_ids)
+            .values("campaign_id", "status")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        for row in rows:
+            fields = values[row["campaign_id"]]
+            fields[counter_field(row["status"])] += row["count"]
+            fields["total"] += row["count"]
+
+        pipe = self.client.pipeline(transaction=False)
+        for campaign_id, fields in values.items():
+            pipe.hset(STATS_KEY.format(campaign_id), mapping=fields)
+            pipe.sadd(DIRTY_KEY, campaign_id)
+        pipe.execute()
+        return len(values)
+
+
+def recent_campaign_ids():
+    # Campaigns that finished since the previous run are recounted too, in
+    # case their final flush was lost. Twice the interval covers a late run.
+    since = timezone.now() - timedelta(
+        seconds=2 * settings.CAMPAIGN_STATS_RECONCILE_INTERVAL
+    )
+    mails = OutgoingMails.objects.filter(campaign_id__isnull=False).order_by()
+    active = mails.filter(status__in=("queued", "sending")).values_list(
+        "campaign_id", flat=True
+    )
+    recent = mails.filter(updated_at__gte=since).values_list("campaign_id", flat=True)
+    return list(active.union(recent))
+
+
+def counter_field(status):
+    # Claimed mails still count as queued until their final status lands.
+    return "queued" if status == "sending" else status
+
+
+def transition_deltas(rows, new_status=None, deltas=None):
+    deltas = {} if deltas is None else deltas
+    for row in rows:
+        fields = deltas.setdefault(row["campaign_id"], {})
+        field = counter_field(row["status"])
+        fields[field] = fields.get(field, 0) - row["count"]
+        if new_status:
+            fields[new_status] = fields.get(new_status, 0) + row["count"]
+        else:
+            fields["total"] = fields.get("total", 0) - row["count"]
+    return deltas
+
+
+def get_campaign_stats(campaign_id):
+    values = counters.get(campaign_id)
+    if values is None:
+        stats = CampaignStats.objects.filter(campaign_id=campaign_id).first()
+        values = {field: getattr(stats, field, 0) for field in FIELDS}
+    return values
+
+
+counters = CampaignCounters()
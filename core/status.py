@@ -0,0 +1,167 @@
+import json
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import OutgoingMails
+from .stats import counters, transition_deltas
+
+PENDING_KEY = "outgoing-mails:status:pending"
+PROCESSING_KEY = "outgoing-mails:status:processing:{}"
+PROCESSING_SET = "outgoing-mails:status:processing"
+FLUSH_LOCK_KEY = "outgoing-mails:status:flush"
+
+# Moves up to ARGV[1] entries from the head of KEYS[1] into the processing
+# list KEYS[2] and registers it in KEYS[3], scored by ARGV[2]. Returns the
+# moved entries.
+TAKE_BATCH_SCRIPT = """
+local values = redis.call("LRANGE", KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #values > 0 then
+    redis.call("RPUSH", KEYS[2], unpack(values))
+    redis.call("LTRIM", KEYS[1], #values, -1)
+    redis.call("ZADD", KEYS[3], ARGV[2], KEYS[2])
+end
+return values
+"""
+
+CLAIM_SQL = f"""
+    UPDATE {OutgoingMails._meta.db_table}
+    SET status = 'sending', updated_at = now()
+    WHERE id = ANY(%s) AND status = 'queued'
+    RETURNING id
+"""
+
+
+def claim_mails(mail_ids):
+    # Claimed rows leave the queued state in the database before anything is
+    # sent, so a redelivered or republished task cannot send them again while
+    # their final status is still buffered.
+    if not mail_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM_SQL, [list(mail_ids)])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def release_mails(mail_ids):
+    if mail_ids:
+        OutgoingMails.objects.filter(id__in=mail_ids, status="sending").update(
+            status="queued"
+        )
+
+
+class StatusBuffer:
+    def __init__(self, client=None, flush_size=None, flush_interval=None):
+        self.client = client or redis.Redis.from_url(settings.CELERY_BROKER_URL)
+        self.flush_size = flush_size or settings.STATUS_FLUSH_SIZE
+        self.flush_interval = flush_interval or settings.STATUS_FLUSH_INTERVAL
+        self.last_flush = time.monotonic()
+        self.take_batch = self.client.register_script(TAKE_BATCH_SCRIPT)
+
+    def push(self, entries):
+        now = time.time()
+        values = [json.dumps([mail_id, status, now]) for mail_id, status in entries]
+        if not values:
+            return
+
+        pending = self.client.rpush(PENDING_KEY, *values)
+        elapsed = time.monotonic() - self.last_flush
+        if pending >= self.flush_size or elapsed >= self.flush_interval:
+            self.flush()
+
+    def lock(self, blocking_timeout=None):
+        return self.client.lock(
+            FLUSH_LOCK_KEY,
+            timeout=settings.STATUS_FLUSH_LOCK_TIMEOUT,
+            blocking_timeout=blocking_timeout,
+        )
+
+    def flush(self):
+        lock = self.lock()
+        if not lock.acquire(blocking=False):
+            return 0
+        try:
+            return self.drain()
+        finally:
+            self.last_flush = time.monotonic()
+            try:
+                lock.release()
+            except redis.exceptions.LockNotOwnedError:
+                pass
+
+    def drain(self):
+        # Callers hold the flush lock. Each batch leaves the pending list
+        # atomically and is only dropped once applied, so a flusher that
+        # outlives its lock cannot discard entries it never applied.
+        flushed = self.recover()
+        while True:
+            processing = PROCESSING_KEY.format(uuid.uuid4().hex)
+            values = self.take_batch(
+                keys=[PENDING_KEY, processing, PROCESSING_SET],
+                args=[self.flush_size, time.time()],
+            )
+            if not values:
+                break
+            self.apply(values)
+            self.finish(processing)
+            flushed += len(values)
+            if len(values) < self.flush_size:
+                break
+        return flushed
+
+    def recover(self):
+        # Batches left behind by a flusher that died before applying them.
+        # Applying a batch twice is harmless, statuses and deltas come from
+        # the rows that still change.
+        cutoff = time.time() - settings.STATUS_PROCESSING_TIMEOUT
+        recovered = 0
+        for processing in self.client.zrangebyscore(PROCESSING_SET, "-inf", cutoff):
+            values = self.client.lrange(processing, 0, -1)
+            if values:
+                self.apply(values)
+                recovered += len(values)
+            self.finish(processing)
+        return recovered
+
+    def finish(self, processing):
+        pipe = self.client.pipeline()
+        pipe.delete(processing)
+        pipe.zrem(PROCESSING_SET, processing)
+        pipe.execute()
+
+    def apply(self, values):
+        latest = {}
+        for value in values:
+            mail_id, status, ts = json.loads(value)
+            latest[mail_id] = (status, ts)
+
+        groups = defaultdict(list)
+        stamps = defaultdict(float)
+        for mail_id, (status, ts) in latest.items():
+            groups[status].append(mail_id)
+            stamps[status] = max(stamps[status], ts)
+
+        deltas = {}
+        with transaction.atomic():
+            for status, mail_ids in groups.items():
+                mails = OutgoingMails.objects.filter(id__in=mail_ids)
+                changed = (
+                    mails.exclude(status=status)
+                    .values("campaign_id", "status")
+                    .annotate(count=Count("id"))
+                )
+                transition_deltas(changed, status, deltas)
+                mails.update(
+                    status=status,
+                    updated_at=datetime.fromtimestamp(stamps[status], tz=timezone.utc),
+                )
+        counters.incr(deltas)
+
+
+status_buffer = StatusBuffer()
@@ -1,34 +1,267 @@
+import uuid
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import EmailMessage
-from django.core.mail.backends.smtp import EmailBackend
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from .content import get_message_prototype
+from .delivery import AsyncDeliveryEngine
+from .importers import fail_import_job, run_import_job
+from .members import reconcile_member_counts
+from .models import Campaign, OutgoingMails
+from .outbox import enqueue_many
+from .ratelimit import limiter
+from .smtp import pool
+from .stats import counters
+from .status import claim_mails, release_mails, status_buffer
+from .utils import chunked
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    pool.close_all()
+
+
+@worker_process_shutdown.connect
+def flush_statuses(**kwargs):
+    status_buffer.flush()
+
+
+@shared_task
+def flush_status_buffer_task():
+    return status_buffer.flush()
+
+
+@shared_task
+def fold_campaign_stats_task():
+    return counters.fold()
+
 
-from .models import OutgoingMails
+@shared_task
+def reconcile_campaign_stats_task():
+    # Flushes are held off until the recounted hashes are written.
+    with status_buffer.lock(blocking_timeout=settings.STATUS_FLUSH_LOCK_WAIT):
+        status_buffer.drain()
+        return counters.reconcile()
+
+
+@shared_task
+def reconcile_member_counts_task():
+    return reconcile_member_counts()
 
 
 @shared_task
-def send_mail_task(mail_id, subject, body, sender, to):
-    mail = OutgoingMails.objects.get(id=mail_id)
-    user = mail.user
-    smtp_creds = user.smtp_creds
+def fail_stale_sending_task():
+    status_buffer.flush()
+    cutoff = timezone.now() - timedelta(seconds=settings.SENDING_TIMEOUT)
+    stale_ids = list(
+        OutgoingMails.objects.filter(status="sending", updated_at__lt=cutoff)
+        .values_list("id", flat=True)
+        .order_by()[: settings.STATUS_FLUSH_SIZE]
+    )
+    update_statuses([], stale_ids)
+    status_buffer.flush()
+    return len(stale_ids)
+
+
+def claim_queued_mails(mail_ids):
+    return (
+        OutgoingMails.objects.filter(id__in=claim_mails(mail_ids))
+        .select_related("user__smtp_creds", "campaign")
+        .defer("campaign__body", "campaign__description")
+    )
+
+
+def build_campaign_message(mail):
+    prototype = get_message_prototype(mail.campaign_id, mail.campaign.updated_at)
+    return prototype.render(mail.sender, mail.to)
+
+
+@shared_task(bind=True)
+def send_mail_task(self, mail_id, *args):
+    # Positional arguments after mail_id are ignored. Older payloads carried
+    # the subject, body, sender and recipient here.
+    mail = claim_queued_mails([mail_id]).first()
+    if mail is None:
+        return
+    smtp_creds = mail.user.smtp_creds
+
+    wait = limiter.acquire(smtp_creds)
+    if wait:
+        release_mails([mail.id])
+        raise self.retry(countdown=wait, max_retries=None)
 
     try:
-        email_backend = EmailBackend(
-            host=smtp_creds.host,
-            port=smtp_creds.port,
-            username=smtp_creds.username,
-            password=smtp_creds.password,
-            use_tls=smtp_creds.use_tls,
-            use_ssl=smtp_creds.use_ssl,
+        message = build_campaign_message(mail)
+        with pool.connection(smtp_creds) as connection:
+            connection.sendmail(message)
+    except Exception as e:
+        update_statuses([], [mail.id])
+        raise e
+    update_statuses([mail.id], [])
+
+
+def update_statuses(sent_ids, failed_ids):
+    status_buffer.push(
+        [(mail_id, "sent") for mail_id in sent_ids]
+        + [(mail_id, "failed") for mail_id in failed_ids]
+    )
+
+
+@shared_task(bind=True)
+def send_mail_batch_task(self, mail_ids):
+    by_creds = {}
+    for mail in claim_queued_mails(mail_ids):
+        by_creds.setdefault(mail.user.smtp_creds, []).append(mail)
+
+    sent_ids = []
+    failed_ids = []
+    deferred_ids = []
+    countdown = 0
+    for smtp_creds, batch in by_creds.items():
+        try:
+            connection = pool.acquire(smtp_creds)
+        except Exception:
+            failed_ids.extend(mail.id for mail in batch)
+            continue
+
+        for index, mail in enumerate(batch):
+            wait = limiter.acquire(smtp_creds)
+            if wait:
+                deferred_ids.extend(pending.id for pending in batch[index:])
+                countdown = max(countdown, wait)
+                break
+            try:
+                message = build_campaign_message(mail)
+                connection.sendmail(message)
+                sent_ids.append(mail.id)
+            except Exception:
+                failed_ids.append(mail.id)
+        pool.release(connection)
+
+    update_statuses(sent_ids, failed_ids)
+    if deferred_ids:
+        release_mails(deferred_ids)
+        self.apply_async((deferred_ids,), countdown=countdown)
+    return {
+        "sent": len(sent_ids),
+        "failed": len(failed_ids),
+        "deferred": len(deferred_ids),
+    }
+
+
+@shared_task(bind=True)
+def send_mail_batch_async_task(self, mail_ids):
+    messages = []
+    failed_ids = []
+    for mail in claim_queued_mails(mail_ids):
+        try:
+            message = build_campaign_message(mail)
+            messages.append((mail.id, mail.user.smtp_creds, message))
+        except Exception:
+            failed_ids.append(mail.id)
+
+    sent_ids, send_failed_ids, deferred_ids, countdown = AsyncDeliveryEngine().run(
+        messages
+    )
+    failed_ids.extend(send_failed_ids)
+
+    update_statuses(sent_ids, failed_ids)
+    if deferred_ids:
+        release_mails(deferred_ids)
+        self.apply_async((deferred_ids,), countdown=countdown)
+    return {
+        "sent": len(sent_ids),
+        "failed": len(failed_ids),
+        "deferred": len(deferred_ids),
+    }
+
+
+def dispatch_mail_ids(mail_ids):
+    if settings.MAIL_DELIVERY_ENGINE == "asyncio":
+        send_task = send_mail_batch_async_task
+    else:
+        send_task = send_mail_batch_task
+
+    enqueue_many(
+        send_task, [(batch,) for batch in chunked(mail_ids, settings.SEND_BATCH_SIZE)]
+    )
+
+
+def lock_fan_out(campaign_id, task_id, email_id):
+    # Another delivery of this run, or a newer run, may already have moved on.
+    campaign = (
+        Campaign.objects.select_for_update()
+        .filter(id=campaign_id, fan_out_task_id=task_id, fan_out_email_id=email_id)
+        .values_list("id", flat=True)
+        .first()
+    )
+    return campaign is not None
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def fan_out_campaign_task(self, campaign_id):
+    # Redeliveries keep the task id and resume after the last email queued,
+    # while a new send of the campaign starts over.
+    task_id = self.request.id or uuid.uuid4().hex
+    Campaign.objects.filter(id=campaign_id).exclude(fan_out_task_id=task_id).update(
+        fan_out_task_id=task_id, fan_out_email_id=None
+    )
+    campaign = Campaign.objects.select_related("user__smtp_creds").get(id=campaign_id)
+    sender = campaign.user.smtp_creds.username
+    chunk_size = settings.FAN_OUT_CHUNK_SIZE
+
+    queued = 0
+    last_email_id = campaign.fan_out_email_id
+    emails = campaign.get_audience().order_by("id")
+    if last_email_id is not None:
+        emails = emails.filter(id__gt=last_email_id)
+    emails = emails.values_list("id", "email").iterator(chunk_size=chunk_size)
+    for chunk in chunked(emails, chunk_size):
+        with transaction.atomic():
+            if not lock_fan_out(campaign_id, task_id, last_email_id):
+                break
+
+            created_mails = OutgoingMails.objects.bulk_create(
+                OutgoingMails(
+                    campaign=campaign,
+                    user=campaign.user,
+                    to=email,
+                    sender=sender,
+                    status="queued",
+                )
+                for _, email in chunk
+            )
+            mail_ids = [mail.id for mail in created_mails]
+            dispatch_mail_ids(mail_ids)
+            last_email_id = chunk[-1][0]
+            Campaign.objects.filter(id=campaign_id).update(
+                fan_out_email_id=last_email_id
+            )
+
+        counters.incr({campaign_id: {"total": len(mail_ids), "queued": len(mail_ids)}})
+
+        queued += len(mail_ids)
+        self.update_state(
+            state="PROGRESS", meta={"campaign": campaign_id, "queued": queued}
         )
-        attachments = mail.campaign.get_attachments()
-        email = EmailMessage(subject, body, sender, [to], connection=email_backend)
-        for attachment in attachments:
-            email.attach_file(attachment.file.path)
-        email.send()
-        mail.status = "sent"
-        mail.save()
+
+    return {"campaign": campaign_id, "queued": queued}
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def import_contacts_task(self, job_id):
+    try:
+        job = run_import_job(job_id)
+    except OperationalError as e:
+        if self.request.retries >= settings.IMPORT_MAX_RETRIES:
+            fail_import_job(job_id, str(e))
+            raise e
+        raise self.retry(exc=e, countdown=settings.IMPORT_RETRY_DELAY)
     except Exception as e:
-        mail = OutgoingMails.objects.get(id=mail_id)
-        mail.status = "failed"
-        mail.save()
+        fail_import_job(job_id, str(e))
         raise e
+    return {"job": job.id, "status": job.status, "rows": job.rows_done}
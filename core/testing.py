@@ -0,0 +1,50 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from account.authentication import auth_cache
+
+
+def auth_client(user):
+    # Budgets measure warm requests, which authenticate from the cache.
+    auth_cache.clear()
+    auth_cache.get(user.id)
+    client = APIClient()
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    return client
+
+
+class QueryBudgetMixin:
+    def measure(self, client, method, path, data=None, format="json"):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, data, format=format)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        return response, len(queries)
+
+    def assertQueryBudget(
+        self,
+        client,
+        budget,
+        path,
+        method="get",
+        data=None,
+        grow=None,
+        format="json",
+    ):
+        response, count = self.measure(client, method, path, data, format)
+        self.assertLess(response.status_code, 400, getattr(response, "data", None))
+        self.assertLessEqual(
+            count, budget, f"{method.upper()} {path} ran {count} queries"
+        )
+        if grow is not None:
+            grow()
+            _, grown = self.measure(client, method, path, data, format)
+            self.assertEqual(
+                grown,
+                count,
+                f"{method.upper()} {path} query count changed with more rows",
+            )
+        return response
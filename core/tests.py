@@ -1,3 +1,2166 @@
-from django.test import TestCase
+import asyncio
+import csv
+import email
+import email.policy
+import io
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import fakeredis
+import openpyxl
+import redis
+from aiosmtpd.controller import Controller
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.mail import EmailMessage
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from account.models import UserSmtpCreds
+
+from .caching import get_stats
+from .content import (
+    MessagePrototype,
+    content_cache,
+    get_campaign_content,
+    get_message_prototype,
+    prototype_cache,
+)
+from .delivery import AsyncDeliveryEngine
+from .importers import (
+    CSVFileReader,
+    import_row_chunks,
+    import_rows,
+    iter_spreadsheet_rows,
+    merge_shards,
+    parse_range,
+    run_import_job,
+    save_checkpoint,
+    split_ranges,
+)
+from .models import (
+    Attachment,
+    Campaign,
+    CampaignRecipient,
+    CampaignStats,
+    Email,
+    EmailMailList,
+    EmailTemplate,
+    ImportJob,
+    MailList,
+    OutboxMessage,
+    OutgoingMails,
+)
+from .lru import LRUCache
+from .members import reconcile_member_counts
+from .outbox import purge, relay
+from .ratelimit import ConcurrencyLimiter, RateLimiter
+from .smtp import SMTPConnectionPool
+from .stats import CampaignCounters, counter_field
+from .status import (
+    FLUSH_LOCK_KEY,
+    PENDING_KEY,
+    PROCESSING_KEY,
+    PROCESSING_SET,
+    StatusBuffer,
+)
+from .tasks import (
+    dispatch_mail_ids,
+    fan_out_campaign_task,
+    reconcile_campaign_stats_task,
+    send_mail_batch_async_task,
+    send_mail_batch_task,
+    send_mail_task,
+)
+from .testing import QueryBudgetMixin, auth_client
+
+USER_MODEL = get_user_model()
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans are Postgres specific")
+class HotPathQueryPlanTests(TestCase):
+    USERS = 20
+    MAILLISTS = 40
+    EMAILS = 20000
+    MAILS_PER_CAMPAIGN = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        users = USER_MODEL.objects.bulk_create(
+            USER_MODEL(email=f"user{i}@example.com", name=f"User {i}")
+            for i in range(cls.USERS)
+        )
+        maillists = MailList.objects.bulk_create(
+            MailList(user=users[i % cls.USERS]) for i in range(cls.MAILLISTS)
+        )
+        emails = Email.objects.bulk_create(
+            Email(email=f"contact{i}@example.com") for i in range(cls.EMAILS)
+        )
+        EmailMailList.objects.bulk_create(
+            EmailMailList(
+                email=email,
+                maillist=maillists[(i + offset) % cls.MAILLISTS],
+                unsubscribed_at="2024-01-01T00:00:00Z" if i % 10 == 0 else None,
+            )
+            for i, email in enumerate(emails)
+            for offset in (0, 1)
+        )
+
+        campaigns = Campaign.objects.bulk_create(
+            Campaign(user=maillist.user, name=f"Campaign {i}", description="Seeded")
+            for i, maillist in enumerate(maillists)
+        )
+        for campaign, maillist in zip(campaigns, maillists):
+            campaign.maillists.add(maillist)
+
+        statuses = ["queued", "sent", "sent", "sent", "failed"]
+        OutgoingMails.objects.bulk_create(
+            OutgoingMails(
+                campaign=campaign,
+                user=campaign.user,
+                sender=campaign.user.email,
+                to=f"contact{i}@example.com",
+                status=statuses[i % len(statuses)],
+            )
+            for campaign in campaigns
+            for i in range(cls.MAILS_PER_CAMPAIGN)
+        )
+
+        with connection.cursor() as cursor:
+            for model in (Email, EmailMailList, MailList, Campaign, OutgoingMails):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+        cls.user = users[0]
+        cls.maillist = maillists[0]
+        cls.campaign = campaigns[0]
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"Expected one of {index_names} in plan:\n{plan}",
+        )
+
+    def test_active_members_use_partial_index(self):
+        members = EmailMailList.objects.filter(
+            maillist=self.maillist, unsubscribed_at__isnull=True
+        ).values_list("email_id", flat=True)
+        self.assertUsesIndex(members, "emailmaillist_active_idx")
+
+    def test_campaign_audience_uses_partial_index(self):
+        self.assertUsesIndex(self.campaign.get_audience(), "emailmaillist_active_idx")
+
+    def test_campaign_mails_by_status_use_composite_index(self):
+        mails = OutgoingMails.objects.filter(campaign=self.campaign, status="queued")
+        self.assertUsesIndex(mails, "outgoing_campaign_status_idx")
+
+    def test_user_mails_by_status_use_composite_index(self):
+        mails = OutgoingMails.objects.filter(
+            user=self.user, status__in=["sent", "failed"]
+        )
+        self.assertUsesIndex(mails, "outgoing_user_status_idx")
+
+    def test_delete_mails_query_uses_composite_index(self):
+        mails = OutgoingMails.objects.filter(
+            campaign=self.campaign.id,
+            status__in=["sent", "failed"],
+            user=self.user,
+        )
+        self.assertUsesIndex(
+            mails, "outgoing_campaign_status_idx", "outgoing_user_status_idx"
+        )
+
+
+def create_user(email, name):
+    user = USER_MODEL.objects.create_user(email=email, name=name, password="secret")
+    smtp_creds = UserSmtpCreds(
+        user=user, username=email, host="smtp.example.com", port=587
+    )
+    smtp_creds.set_password("secret")
+    smtp_creds.save()
+    return user
+
+
+class FakeSMTPConnection:
+    def __init__(self, fail_for=()):
+        self.fail_for = fail_for
+        self.sent = []
+
+    def sendmail(self, message):
+        if message.recipients[0] in self.fail_for:
+            raise OSError("Rejected")
+        self.sent.append(message.recipients[0])
+
+
+class FakeSMTPPool:
+    def __init__(self, connection):
+        self.smtp_connection = connection
+
+    def acquire(self, smtp_creds):
+        return self.smtp_connection
+
+    def release(self, connection):
+        pass
+
+    @contextmanager
+    def connection(self, smtp_creds):
+        yield self.smtp_connection
+
+
+class SendTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("sender@example.com", "Sender")
+        cls.campaign = Campaign.objects.create(
+            user=cls.user, name="Launch", description="Launch", body="<p>Hi</p>"
+        )
+
+    def setUp(self):
+        redis_client = fakeredis.FakeRedis()
+        self.counters = CampaignCounters(client=redis_client)
+        self.status_buffer = StatusBuffer(
+            client=redis_client, flush_size=1000, flush_interval=3600
+        )
+        for target, value in (
+            ("core.signals.counters", self.counters),
+            ("core.stats.counters", self.counters),
+            ("core.status.counters", self.counters),
+            ("core.tasks.counters", self.counters),
+            ("core.tasks.status_buffer", self.status_buffer),
+            ("core.delivery.default_slots", ConcurrencyLimiter(client=redis_client)),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_mails(self, count, prefix="contact"):
+        mails = OutgoingMails.objects.bulk_create(
+            OutgoingMails(
+                campaign=self.campaign,
+                user=self.user,
+                sender=self.user.email,
+                to=f"{prefix}{i}@example.com",
+                status="queued",
+            )
+            for i in range(count)
+        )
+        return [mail.id for mail in mails]
+
+    def statuses(self, mail_ids):
+        return sorted(
+            OutgoingMails.objects.filter(id__in=mail_ids).values_list(
+                "status", flat=True
+            )
+        )
+
+
+@override_settings(SMTP_RATE_LIMIT_ENABLED=False)
+class SendClaimTests(SendTestCase):
+    def test_redelivered_batch_is_sent_once(self):
+        mail_ids = self.create_mails(3)
+        connection = FakeSMTPConnection()
+        with mock.patch("core.tasks.pool", FakeSMTPPool(connection)):
+            first = send_mail_batch_task(mail_ids)
+            second = send_mail_batch_task(mail_ids)
+
+        self.assertEqual(len(connection.sent), 3)
+        self.assertEqual(first["sent"], 3)
+        self.assertEqual(second, {"sent": 0, "failed": 0, "deferred": 0})
+        self.assertEqual(self.statuses(mail_ids), ["sending"] * 3)
+
+        self.status_buffer.flush()
+        self.assertEqual(self.statuses(mail_ids), ["sent"] * 3)
+
+
+class StatusBufferTests(SendTestCase):
+    def test_flusher_that_outlives_its_lock_keeps_the_next_batch(self):
+        mail_ids = self.create_mails(4)
+        self.counters.incr({self.campaign.id: {"total": 4, "queued": 4}})
+        other = StatusBuffer(client=self.status_buffer.client, flush_size=1000)
+        self.status_buffer.push([(mail_ids[0], "sent"), (mail_ids[1], "sent")])
+        apply = self.status_buffer.apply
+
+        def slow_apply(values):
+            # The lock expires and another worker flushes newer statuses.
+            self.status_buffer.client.delete(FLUSH_LOCK_KEY)
+            self.status_buffer.push([(mail_ids[2], "sent"), (mail_ids[3], "failed")])
+            self.assertEqual(other.flush(), 2)
+            apply(values)
+
+        with mock.patch.object(self.status_buffer, "apply", side_effect=slow_apply):
+            self.assertEqual(self.status_buffer.flush(), 2)
+
+        self.assertEqual(self.statuses(mail_ids), ["failed", "sent", "sent", "sent"])
+        self.assertEqual(
+            self.counters.get(self.campaign.id),
+            {"total": 4, "queued": 0, "sent": 3, "failed": 1},
+        )
+        self.assertEqual(self.status_buffer.client.zcard(PROCESSING_SET), 0)
+
+    @override_settings(STATUS_PROCESSING_TIMEOUT=60)
+    def test_batches_of_a_dead_flusher_are_recovered(self):
+        mail_ids = self.create_mails(2)
+        self.status_buffer.push([(mail_ids[0], "sent"), (mail_ids[1], "sent")])
+        processing = PROCESSING_KEY.format("dead")
+        self.status_buffer.take_batch(
+            keys=[PENDING_KEY, processing, PROCESSING_SET], args=[1000, time.time()]
+        )
+        self.assertEqual(self.status_buffer.flush(), 0)
+        self.assertEqual(self.statuses(mail_ids), ["queued", "queued"])
+
+        self.status_buffer.client.zadd(PROCESSING_SET, {processing: time.time() - 61})
+        self.assertEqual(self.status_buffer.flush(), 2)
+        self.assertEqual(self.statuses(mail_ids), ["sent", "sent"])
+        self.assertFalse(self.status_buffer.client.exists(processing))
+
+
+@override_settings(SMTP_RATE_LIMIT_ENABLED=False)
+class SendBatchTests(SendTestCase):
+    def test_failed_recipients_do_not_stop_the_batch(self):
+        mail_ids = self.create_mails(3)
+        connection = FakeSMTPConnection(fail_for=["contact1@example.com"])
+        with mock.patch("core.tasks.pool", FakeSMTPPool(connection)):
+            result = send_mail_batch_task(mail_ids)
+
+        self.assertEqual(result, {"sent": 2, "failed": 1, "deferred": 0})
+        self.assertEqual(
+            sorted(connection.sent), ["contact0@example.com", "contact2@example.com"]
+        )
+        self.status_buffer.flush()
+        self.assertEqual(self.statuses(mail_ids), ["failed", "sent", "sent"])
+
+    def test_connection_failure_fails_the_account_batch(self):
+        mail_ids = self.create_mails(2)
+        pool = mock.Mock(acquire=mock.Mock(side_effect=OSError("Refused")))
+        with mock.patch("core.tasks.pool", pool):
+            result = send_mail_batch_task(mail_ids)
+
+        self.assertEqual(result, {"sent": 0, "failed": 2, "deferred": 0})
+        self.status_buffer.flush()
+        self.assertEqual(self.statuses(mail_ids), ["failed", "failed"])
+
+    def test_throttled_mails_are_deferred_to_a_new_task(self):
+        mail_ids = self.create_mails(3)
+        connection = FakeSMTPConnection()
+        with mock.patch("core.tasks.pool", FakeSMTPPool(connection)), mock.patch(
+            "core.tasks.limiter.acquire", side_effect=[0, 4.0]
+        ), mock.patch.object(send_mail_batch_task, "apply_async") as apply_async:
+            result = send_mail_batch_task(mail_ids)
+
+        self.assertEqual(result, {"sent": 1, "failed": 0, "deferred": 2})
+        deferred_ids = apply_async.call_args.args[0][0]
+        self.assertEqual(len(deferred_ids), 2)
+        self.assertEqual(apply_async.call_args.kwargs["countdown"], 4.0)
+        self.assertEqual(self.statuses(deferred_ids), ["queued", "queued"])
+
+
+class CampaignContentCacheTests(SendTestCase):
+    def setUp(self):
+        super().setUp()
+        content_cache.clear()
+        prototype_cache.clear()
+
+    def test_lru_evicts_least_recently_used_entries(self):
+        entries = LRUCache(maxsize=2)
+        entries.set("a", 1)
+        entries.set("b", 2)
+        entries.get("a")
+        entries.set("c", 3)
+        self.assertEqual(
+            (entries.get("a"), entries.get("b"), entries.get("c")), (1, None, 3)
+        )
+
+        sized = LRUCache(maxbytes=10, sizeof=len)
+        sized.set("a", b"x" * 6)
+        sized.set("b", b"y" * 6)
+        self.assertIsNone(sized.get("a"))
+        self.assertEqual(sized.bytes, 6)
+
+    def test_content_is_loaded_once_per_campaign_version(self):
+        updated_at = self.campaign.updated_at
+        with self.assertNumQueries(2):
+            content = get_campaign_content(self.campaign.id, updated_at)
+        with self.assertNumQueries(0):
+            self.assertIs(get_campaign_content(self.campaign.id, updated_at), content)
+
+        self.campaign.body = "<p>Changed</p>"
+        self.campaign.save()
+        content = get_campaign_content(self.campaign.id, self.campaign.updated_at)
+        self.assertEqual(content.body, "<p>Changed</p>")
+
+    @override_settings(SEND_BATCH_SIZE=2)
+    def test_send_payloads_carry_only_mail_ids(self):
+        mail_ids = self.create_mails(3)
+        dispatch_mail_ids(mail_ids)
+        self.assertEqual(
+            list(OutboxMessage.objects.order_by("id").values_list("args", flat=True)),
+            [[mail_ids[:2]], [mail_ids[2:]]],
+        )
+
+    @override_settings(SMTP_RATE_LIMIT_ENABLED=False)
+    def test_send_mail_task_ignores_legacy_arguments(self):
+        (mail_id,) = self.create_mails(1)
+        connection = FakeSMTPConnection()
+        with mock.patch("core.tasks.pool", FakeSMTPPool(connection)):
+            send_mail_task(mail_id, "Subject", "<p>Old</p>", "old@example.com", "x")
+        self.assertEqual(connection.sent, ["contact0@example.com"])
+
+
+class MessagePrototypeTests(TestCase):
+    def setUp(self):
+        prototype_cache.clear()
+        content_cache.clear()
+        self.attachment = tempfile.NamedTemporaryFile(suffix=".txt")
+        self.attachment.write(b"brochure")
+        self.attachment.flush()
+        self.addCleanup(self.attachment.close)
+        self.content = SimpleNamespace(
+            version=1,
+            subject="Launch",
+            body="<p>Hi</p>",
+            attachments=[self.attachment.name],
+        )
+
+    def test_render_prepends_per_recipient_headers(self):
+        prototype = MessagePrototype(self.content)
+        first = prototype.render("sender@example.com", "one@example.com")
+        second = prototype.render("sender@example.com", "two@example.com")
+
+        self.assertEqual(first.recipients, ["one@example.com"])
+        message = email.message_from_bytes(first.data, policy=email.policy.default)
+        self.assertEqual(message["To"], "one@example.com")
+        self.assertEqual(message["Subject"], "Launch")
+        self.assertNotEqual(
+            message["Message-ID"], email.message_from_bytes(second.data)["Message-ID"]
+        )
+        attachment = next(message.iter_attachments())
+        self.assertEqual(attachment.get_content(), "brochure")
+        self.assertTrue(first.data.endswith(prototype.data))
+
+    def test_long_headers_are_folded_with_crlf(self):
+        sender = f"{'Ünïcödé Sender ' * 8}<sender@example.com>"
+        prepared = MessagePrototype(self.content).render(sender, "one@example.com")
+
+        head = prepared.data.split(b"\r\n\r\n", 1)[0]
+        self.assertIn(b"\r\n ", head)
+        self.assertIsNone(re.search(rb"(?<!\r)\n", head))
+        # Matches what Django's own EmailMessage produces for the same sender.
+        reference = EmailMessage("Launch", "<p>Hi</p>", sender, ["one@example.com"])
+        expected = email.message_from_bytes(
+            reference.message().as_bytes(), policy=email.policy.default
+        )["From"]
+        message = email.message_from_bytes(prepared.data, policy=email.policy.default)
+        self.assertEqual(message["From"].addresses, expected.addresses)
+
+    def test_prototypes_are_cached_per_campaign_version(self):
+        user = create_user("owner@example.com", "Owner")
+        campaign = Campaign.objects.create(
+            user=user, name="Launch", description="Launch", body="<p>Hi</p>"
+        )
+        prototype = get_message_prototype(campaign.id, campaign.updated_at)
+        with self.assertNumQueries(0):
+            self.assertIs(
+                get_message_prototype(campaign.id, campaign.updated_at), prototype
+            )
+
+        campaign.save()
+        self.assertIsNot(
+            get_message_prototype(campaign.id, campaign.updated_at), prototype
+        )
+
+
+class FanOutTests(SendTestCase):
+    def fan_out(self, task_id):
+        return fan_out_campaign_task.apply(
+            (self.campaign.id,), task_id=str(task_id)
+        ).get()
+
+    def add_members(self, count):
+        maillist = MailList.objects.create(user=self.user)
+        emails = Email.objects.bulk_create(
+            Email(email=f"member{i}@example.com") for i in range(count)
+        )
+        EmailMailList.objects.bulk_create(
+            EmailMailList(email=email, maillist=maillist) for email in emails
+        )
+        self.campaign.maillists.add(maillist)
+
+    def queued_to(self):
+        mails = OutgoingMails.objects.filter(campaign=self.campaign)
+        return sorted(mails.values_list("to", flat=True))
+
+    @override_settings(FAN_OUT_CHUNK_SIZE=3, SEND_BATCH_SIZE=2)
+    def test_campaign_fans_out_in_chunks_through_the_outbox(self):
+        maillist = MailList.objects.create(user=self.user)
+        emails = Email.objects.bulk_create(
+            Email(email=f"member{i}@example.com") for i in range(5)
+        )
+        EmailMailList.objects.bulk_create(
+            EmailMailList(
+                email=email,
+                maillist=maillist,
+                unsubscribed_at=timezone.now() if i == 4 else None,
+            )
+            for i, email in enumerate(emails)
+        )
+        self.campaign.maillists.add(maillist)
+
+        response = auth_client(self.user).post(
+            "/core/api/create-send-pending-mails/", {"campaign": self.campaign.id}
+        )
+        self.assertEqual(response.status_code, 202)
+        message = OutboxMessage.objects.get(task_id=response.data["task_id"])
+        self.assertEqual(message.args, [self.campaign.id])
+
+        with mock.patch.object(fan_out_campaign_task, "update_state") as update_state:
+            result = self.fan_out(message.task_id)
+
+        self.assertEqual(result, {"campaign": self.campaign.id, "queued": 4})
+        self.assertEqual(
+            [call.kwargs["meta"]["queued"] for call in update_state.call_args_list],
+            [3, 4],
+        )
+        mails = OutgoingMails.objects.filter(campaign=self.campaign)
+        self.assertEqual(
+            sorted(mails.values_list("to", flat=True)),
+            [f"member{i}@example.com" for i in range(4)],
+        )
+        batches = OutboxMessage.objects.exclude(id=message.id).order_by("id")
+        self.assertEqual([len(batch.args[0]) for batch in batches], [2, 1, 1])
+        self.assertEqual(
+            self.counters.get(self.campaign.id),
+            {"total": 4, "queued": 4, "sent": 0, "failed": 0},
+        )
+
+    @override_settings(FAN_OUT_CHUNK_SIZE=2)
+    def test_redelivered_run_queues_each_recipient_once(self):
+        self.add_members(5)
+        self.assertEqual(self.fan_out("run-1")["queued"], 5)
+        self.assertEqual(self.fan_out("run-1")["queued"], 0)
+        self.assertEqual(self.queued_to(), [f"member{i}@example.com" for i in range(5)])
+        self.assertEqual(self.counters.get(self.campaign.id)["total"], 5)
+
+        self.assertEqual(self.fan_out("run-2")["queued"], 5)
+        self.assertEqual(OutgoingMails.objects.count(), 10)
+
+    @override_settings(FAN_OUT_CHUNK_SIZE=2)
+    def test_crashed_run_resumes_after_the_last_committed_chunk(self):
+        self.add_members(5)
+        with mock.patch(
+            "core.tasks.dispatch_mail_ids", side_effect=[None, RuntimeError]
+        ):
+            with self.assertRaises(RuntimeError):
+                self.fan_out("run-1")
+        self.assertEqual(len(self.queued_to()), 2)
+
+        self.assertEqual(self.fan_out("run-1")["queued"], 3)
+        self.assertEqual(self.queued_to(), [f"member{i}@example.com" for i in range(5)])
+
+    @override_settings(FAN_OUT_CHUNK_SIZE=2)
+    def test_superseded_run_stops_at_the_checkpoint_lock(self):
+        self.add_members(5)
+
+        def take_over(mail_ids):
+            Campaign.objects.filter(id=self.campaign.id).update(fan_out_task_id="run-2")
+
+        with mock.patch("core.tasks.dispatch_mail_ids", side_effect=take_over):
+            self.assertEqual(self.fan_out("run-1")["queued"], 2)
+        self.assertEqual(len(self.queued_to()), 2)
+
+
+class OutboxRelayTests(TransactionTestCase):
+    def setUp(self):
+        self.messages = OutboxMessage.objects.bulk_create(
+            OutboxMessage(task_name="core.tasks.send_mail_batch_task", args=[[i]])
+            for i in range(3)
+        )
+        patcher = mock.patch("core.outbox.current_app")
+        self.app = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent_task_ids(self):
+        return [call.kwargs["task_id"] for call in self.app.send_task.call_args_list]
+
+    def test_relay_publishes_pending_messages_in_order(self):
+        self.assertEqual(relay(2), 2)
+        self.assertEqual(relay(2), 1)
+        self.assertEqual(relay(2), 0)
+        self.assertEqual(
+            self.sent_task_ids(), [str(message.task_id) for message in self.messages]
+        )
+        self.assertFalse(OutboxMessage.objects.filter(relayed_at__isnull=True).exists())
+
+    def test_relay_skips_rows_locked_by_another_relay(self):
+        locked = threading.Event()
+        done = threading.Event()
+
+        def hold_first_row():
+            with transaction.atomic():
+                OutboxMessage.objects.select_for_update().get(id=self.messages[0].id)
+                locked.set()
+                done.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=hold_first_row)
+        thread.start()
+        locked.wait(10)
+        try:
+            self.assertEqual(relay(10), 2)
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(
+            self.sent_task_ids(),
+            [str(message.task_id) for message in self.messages[1:]],
+        )
+        self.assertEqual(relay(10), 1)
+
+    def test_purge_removes_only_relayed_messages(self):
+        relay(1)
+        self.assertEqual(purge(timezone.now() + timedelta(seconds=1)), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+
+class CampaignCountersTests(SendTestCase):
+    def test_incr_seeds_from_folded_stats(self):
+        CampaignStats.objects.create(campaign=self.campaign, total=5, sent=5)
+        self.counters.incr({self.campaign.id: {"total": 2, "queued": 2}})
+        self.assertEqual(
+            self.counters.get(self.campaign.id),
+            {"total": 7, "queued": 2, "sent": 5, "failed": 0},
+        )
+
+    def test_fold_persists_counters_and_drops_deleted_campaigns(self):
+        deleted = Campaign.objects.create(
+            user=self.user, name="Old", description="Old", body="<p>Hi</p>"
+        )
+        self.counters.incr(
+            {
+                self.campaign.id: {"total": 3, "queued": 1, "sent": 2},
+                deleted.id: {"total": 1, "queued": 1},
+            }
+        )
+        with mock.patch.object(
+            self.counters, "clear", side_effect=redis.RedisError
+        ), self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+
+        self.assertEqual(self.counters.fold(), 1)
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual((stats.total, stats.queued, stats.sent), (3, 1, 2))
+        self.assertIsNone(self.counters.get(deleted.id))
+
+    def test_reconcile_recounts_active_campaigns(self):
+        mail_ids = self.create_mails(4)
+        OutgoingMails.objects.filter(id=mail_ids[0]).update(status="sent")
+        OutgoingMails.objects.filter(id=mail_ids[1]).update(status="sending")
+        self.counters.incr({self.campaign.id: {"total": 9, "failed": 4}})
+
+        self.assertEqual(self.counters.reconcile(), 1)
+        self.assertEqual(
+            self.counters.get(self.campaign.id),
+            {"total": 4, "queued": 3, "sent": 1, "failed": 0},
+        )
+
+    def test_reconcile_recounts_recently_finished_campaigns(self):
+        mail_ids = self.create_mails(2)
+        OutgoingMails.objects.filter(id__in=mail_ids).update(
+            status="sent", updated_at=timezone.now()
+        )
+        self.counters.incr({self.campaign.id: {"total": 2, "queued": 2}})
+
+        self.assertEqual(self.counters.reconcile(), 1)
+        self.assertEqual(self.counters.get(self.campaign.id)["queued"], 0)
+
+        OutgoingMails.objects.filter(id__in=mail_ids).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(self.counters.reconcile(), 0)
+
+    def test_flush_during_reconcile_waits_for_the_recount(self):
+        mail_ids = self.create_mails(2)
+        self.counters.incr({self.campaign.id: {"total": 2, "queued": 2}})
+        flushed = []
+
+        def flush_midway(status):
+            # Another worker finishes a send between the count and the write.
+            if not flushed:
+                self.status_buffer.push([(mail_ids[0], "sent")])
+                flushed.append(self.status_buffer.flush())
+            return counter_field(status)
+
+        with mock.patch("core.stats.counter_field", side_effect=flush_midway):
+            reconcile_campaign_stats_task()
+
+        self.assertEqual(flushed, [0])
+        self.assertEqual(self.status_buffer.flush(), 1)
+        self.assertEqual(
+            self.counters.get(self.campaign.id),
+            {"total": 2, "queued": 1, "sent": 1, "failed": 0},
+        )
+
+    def test_progress_reads_live_counters_then_folded_stats(self):
+        path = f"/core/api/campaigns/{self.campaign.id}/progress/"
+        CampaignStats.objects.create(campaign=self.campaign, total=2, sent=2)
+        response = auth_client(self.user).get(path)
+        self.assertEqual(response.data["sent"], 2)
+
+        mail_ids = self.create_mails(2)
+        self.counters.incr({self.campaign.id: {"total": 2, "queued": 2}})
+        with mock.patch("core.tasks.pool", FakeSMTPPool(FakeSMTPConnection())):
+            with override_settings(SMTP_RATE_LIMIT_ENABLED=False):
+                send_mail_batch_task(mail_ids)
+        self.status_buffer.flush()
+
+        response = auth_client(self.user).get(path)
+        self.assertEqual(
+            response.data,
+            {
+                "campaign": self.campaign.id,
+                "total": 4,
+                "queued": 0,
+                "sent": 4,
+                "failed": 0,
+            },
+        )
+
+
+@override_settings(
+    SMTP_RATE_LIMIT_ENABLED=True,
+    SMTP_ACCOUNT_RATE=1,
+    SMTP_ACCOUNT_BURST=3,
+    SMTP_HOST_RATE=100,
+    SMTP_HOST_BURST=100,
+    SMTP_HOST_RATE_LIMITS={},
+)
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.limiter = RateLimiter(client=self.client)
+        self.smtp_creds = UserSmtpCreds(id=1, host="smtp.example.com")
+
+    def test_burst_then_throttle(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.acquire(self.smtp_creds), 0)
+        wait = self.limiter.acquire(self.smtp_creds)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 1)
+
+    def test_bucket_refills_with_elapsed_time(self):
+        for _ in range(3):
+            self.limiter.acquire(self.smtp_creds)
+        self.assertGreater(self.limiter.acquire(self.smtp_creds), 0)
+
+        key = "smtp-rate:account:1"
+        ts = float(self.client.hget(key, "ts"))
+        self.client.hset(key, "ts", ts - 2)
+        self.assertEqual(self.limiter.acquire(self.smtp_creds), 0)
+        self.assertEqual(self.limiter.acquire(self.smtp_creds), 0)
+        self.assertGreater(self.limiter.acquire(self.smtp_creds), 0)
+
+    def test_host_override_applies_across_accounts(self):
+        other_creds = UserSmtpCreds(id=2, host="smtp.example.com")
+        with override_settings(SMTP_HOST_RATE_LIMITS={"smtp.example.com": (1, 2)}):
+            self.assertEqual(self.limiter.acquire(self.smtp_creds), 0)
+            self.assertEqual(self.limiter.acquire(other_creds), 0)
+            self.assertGreater(self.limiter.acquire(other_creds), 0)
+        # The throttled attempt must not have taken an account token.
+        self.assertEqual(float(self.client.hget("smtp-rate:account:2", "tokens")), 2)
+
+    def test_disabled_limiter_never_waits(self):
+        with override_settings(SMTP_RATE_LIMIT_ENABLED=False):
+            for _ in range(5):
+                self.assertEqual(self.limiter.acquire(self.smtp_creds), 0)
+
+
+@override_settings(
+    ASYNC_DELIVERY_ACCOUNT_CONCURRENCY=2,
+    ASYNC_DELIVERY_HOST_CONCURRENCY=3,
+    ASYNC_DELIVERY_SLOT_LEASE=60,
+)
+class ConcurrencyLimiterTests(TestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.slots = ConcurrencyLimiter(client=self.client)
+        self.smtp_creds = UserSmtpCreds(id=1, host="smtp.example.com")
+
+    def test_slots_are_capped_until_released(self):
+        first = self.slots.acquire(self.smtp_creds)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(self.slots.acquire(self.smtp_creds))
+        self.assertIsNone(self.slots.acquire(self.smtp_creds))
+
+        self.slots.release(self.smtp_creds, first)
+        self.assertIsNotNone(self.slots.acquire(self.smtp_creds))
+
+    def test_host_cap_applies_across_accounts(self):
+        other_creds = UserSmtpCreds(id=2, host="smtp.example.com")
+        self.slots.acquire(self.smtp_creds)
+        self.slots.acquire(self.smtp_creds)
+        self.assertIsNotNone(self.slots.acquire(other_creds))
+        self.assertIsNone(self.slots.acquire(other_creds))
+        # The refused attempt must not have taken an account slot.
+        self.assertEqual(self.client.zcard("smtp-slots:account:2"), 1)
+
+    def test_expired_leases_are_given_back(self):
+        tokens = [self.slots.acquire(self.smtp_creds) for _ in range(2)]
+        self.assertIsNone(self.slots.acquire(self.smtp_creds))
+
+        for token in tokens:
+            self.client.zadd("smtp-slots:account:1", {token: 0})
+        self.assertIsNotNone(self.slots.acquire(self.smtp_creds))
+
+
+class AsyncThrottleTests(SendTestCase):
+    def test_throttled_mails_are_released_and_requeued(self):
+        mail_ids = self.create_mails(3)
+        with mock.patch(
+            "core.delivery.default_limiter.acquire", return_value=2.5
+        ), mock.patch.object(send_mail_batch_async_task, "apply_async") as apply_async:
+            result = send_mail_batch_async_task(mail_ids)
+
+        self.assertEqual(result, {"sent": 0, "failed": 0, "deferred": 3})
+        self.assertEqual(sorted(apply_async.call_args.args[0][0]), sorted(mail_ids))
+        self.assertEqual(apply_async.call_args.kwargs["countdown"], 2.5)
+        self.assertEqual(self.statuses(mail_ids), ["queued"] * 3)
+
+
+class SinkHandler:
+    def __init__(self):
+        self.received = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("reject"):
+            return "550 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.05)
+        self.active -= 1
+        self.received.extend(envelope.rcpt_tos)
+        return "250 Message accepted"
+
+
+class SMTPSinkTestCase(TestCase):
+    def setUp(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.handler = SinkHandler()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=port)
+        self.controller.start()
+        self.addCleanup(self.controller.stop)
+        self.smtp_creds = UserSmtpCreds(
+            id=1, host="127.0.0.1", port=port, use_tls=False, use_ssl=False
+        )
+        self.smtp_creds.set_password("secret")
+
+    def message(self, to):
+        return SimpleNamespace(
+            from_email="sender@example.com",
+            recipients=[to],
+            data=f"Subject: Hi\r\nTo: {to}\r\n\r\nHello",
+        )
+
+
+class SMTPConnectionPoolTests(SMTPSinkTestCase):
+    def test_released_connections_are_reused(self):
+        pool = SMTPConnectionPool(idle_timeout=60, max_messages=10)
+        with pool.connection(self.smtp_creds) as connection:
+            connection.sendmail(self.message("one@example.com"))
+        with pool.connection(self.smtp_creds) as reused:
+            reused.sendmail(self.message("two@example.com"))
+
+        self.assertIs(reused, connection)
+        self.assertEqual(reused.sent, 2)
+        self.assertEqual(self.handler.received, ["one@example.com", "two@example.com"])
+        pool.close_all()
+
+    def test_connections_are_recycled_after_max_messages(self):
+        pool = SMTPConnectionPool(idle_timeout=60, max_messages=2)
+        connection = pool.acquire(self.smtp_creds)
+        connection.sendmail(self.message("one@example.com"))
+        connection.sendmail(self.message("two@example.com"))
+        pool.release(connection)
+
+        self.assertIsNone(connection.backend.connection)
+        fresh = pool.acquire(self.smtp_creds)
+        self.assertIsNot(fresh, connection)
+        self.assertEqual(fresh.sent, 0)
+        fresh.close()
+
+    def test_idle_and_dead_connections_are_replaced(self):
+        pool = SMTPConnectionPool(idle_timeout=10, max_messages=10)
+        idle = pool.acquire(self.smtp_creds)
+        idle.last_used -= 60
+        pool.release(idle)
+        self.assertIsNot(pool.acquire(self.smtp_creds), idle)
+
+        pool = SMTPConnectionPool(idle_timeout=60, max_messages=10)
+        dead = pool.acquire(self.smtp_creds)
+        pool.release(dead)
+        dead.backend.connection.sock.shutdown(socket.SHUT_RDWR)
+        replacement = pool.acquire(self.smtp_creds)
+        self.assertIsNot(replacement, dead)
+        replacement.sendmail(self.message("one@example.com"))
+        self.assertEqual(self.handler.received, ["one@example.com"])
+        replacement.close()
+
+    def test_saved_credentials_get_fresh_connections(self):
+        pool = SMTPConnectionPool(idle_timeout=60, max_messages=10)
+        with pool.connection(self.smtp_creds) as connection:
+            pass
+        self.smtp_creds.updated_at = timezone.now()
+        with pool.connection(self.smtp_creds) as fresh:
+            pass
+
+        self.assertIsNot(fresh, connection)
+        pool.close_all()
+
+    def test_dropped_connection_is_reopened_for_the_send(self):
+        pool = SMTPConnectionPool(idle_timeout=60, max_messages=10)
+        connection = pool.acquire(self.smtp_creds)
+        connection.backend.connection.sock.shutdown(socket.SHUT_RDWR)
+        connection.sendmail(self.message("one@example.com"))
+        self.assertEqual(self.handler.received, ["one@example.com"])
+        connection.close()
+
+
+@override_settings(ASYNC_DELIVERY_SLOT_POLL=0.01)
+class AsyncDeliveryEngineTests(SMTPSinkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limiter = mock.Mock(acquire=mock.Mock(return_value=0))
+        self.slots = ConcurrencyLimiter(client=fakeredis.FakeRedis())
+
+    def engine(self):
+        return AsyncDeliveryEngine(limiter=self.limiter, slots=self.slots)
+
+    def messages(self, count, start=0):
+        return [
+            (i, self.smtp_creds, self.message(f"contact{i}@example.com"))
+            for i in range(start, start + count)
+        ]
+
+    def test_delivers_and_reports_refused_recipients(self):
+        messages = [
+            (1, self.smtp_creds, self.message("one@example.com")),
+            (2, self.smtp_creds, self.message("reject@example.com")),
+            (3, self.smtp_creds, self.message("two@example.com")),
+        ]
+        sent_ids, failed_ids, deferred_ids, _ = self.engine().run(messages)
+
+        self.assertEqual(sorted(sent_ids), [1, 3])
+        self.assertEqual(failed_ids, [2])
+        self.assertEqual(deferred_ids, [])
+        self.assertEqual(
+            sorted(self.handler.received), ["one@example.com", "two@example.com"]
+        )
+
+    @override_settings(ASYNC_DELIVERY_ACCOUNT_CONCURRENCY=2)
+    def test_account_concurrency_is_capped_across_batches(self):
+        async def deliver_batches():
+            return await asyncio.gather(
+                self.engine().deliver(self.messages(4)),
+                self.engine().deliver(self.messages(4, start=4)),
+            )
+
+        results = asyncio.run(deliver_batches())
+
+        self.assertEqual(sum(len(sent_ids) for sent_ids, *_ in results), 8)
+        self.assertEqual(self.handler.max_active, 2)
+        self.assertEqual(self.slots.client.zcard("smtp-slots:account:1"), 0)
+
+    @override_settings(
+        ASYNC_DELIVERY_ACCOUNT_CONCURRENCY=1, ASYNC_DELIVERY_SLOT_WAIT=0.05
+    )
+    def test_sends_without_a_free_slot_are_deferred(self):
+        self.slots.acquire(self.smtp_creds)
+        sent_ids, failed_ids, deferred_ids, countdown = self.engine().run(
+            self.messages(3)
+        )
+
+        self.assertEqual((sent_ids, failed_ids), ([], []))
+        self.assertEqual(sorted(deferred_ids), [0, 1, 2])
+        self.assertEqual(countdown, 0.05)
+        self.assertEqual(self.handler.received, [])
+
+
+class ImportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("importer@example.com", "Importer")
+        cls.maillist = MailList.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def write_file(self, content, name="contacts.csv"):
+        path = os.path.join(self.media_root, name)
+        with open(path, "wb") as file:
+            file.write(content.encode() if isinstance(content, str) else content)
+        return path
+
+    def create_job(self, content, name="contacts.csv", **fields):
+        job = ImportJob(user=self.user, maillist=self.maillist, **fields)
+        content = content.encode() if isinstance(content, str) else content
+        job.file.save(name, ContentFile(content), save=False)
+        job.total_bytes = len(content)
+        job.save()
+        return job
+
+
+def contacts_csv(count, header="email,first_name,last_name\n"):
+    return header + "".join(
+        f"contact{i}@example.com,First{i},Last{i}\n" for i in range(count)
+    )
+
+
+class CSVImportTests(ImportTestCase):
+    def test_reader_maps_header_aliases_and_resumes_at_offset(self):
+        path = self.write_file(
+            "\ufeffEmail Address,Surname,Given Name\n"
+            "ann@example.com,Smith,Ann\n"
+            "bob@example.com,Jones,Bob\n"
+        )
+        with open(path, "rb") as file:
+            reader = CSVFileReader(file)
+            rows = iter(reader)
+            self.assertEqual(next(rows), ["ann@example.com", "Ann", "Smith"])
+            offset = reader.offset
+        with open(path, "rb") as file:
+            self.assertEqual(
+                list(CSVFileReader(file, offset)), [["bob@example.com", "Bob", "Jones"]]
+            )
+
+    def test_orm_import_upserts_contacts_in_chunks(self):
+        Email.objects.create(email="ann@example.com", first_name="Kept")
+        rows = [
+            ["ann@example.com", "Ann", ""],
+            ["not-an-email", "", ""],
+            ["bob@example.com", "Bob", ""],
+            ["bob@example.com", "Bob", ""],
+            ["cid@example.com", "Cid", ""],
+        ]
+        summary = import_rows(rows, self.maillist, chunk_size=2, mode="orm")
+        self.assertEqual(
+            summary,
+            {
+                "rows": 5,
+                "inserted": 2,
+                "existing": 1,
+                "invalid": 1,
+                "duplicates": 1,
+                "samples": [{"row": 2, "value": "not-an-email,,"}],
+            },
+        )
+        self.assertEqual(Email.objects.get(email="ann@example.com").first_name, "Kept")
+        self.maillist.refresh_from_db()
+        self.assertEqual(self.maillist.active_count, 3)
+        self.assertEqual(
+            EmailMailList.objects.filter(maillist=self.maillist).count(), 3
+        )
+
+        summary = import_rows(rows, self.maillist, mode="orm")
+        self.assertEqual((summary["inserted"], summary["existing"]), (0, 3))
+        self.maillist.refresh_from_db()
+        self.assertEqual(self.maillist.active_count, 3)
+
+
+class CopyImportTests(ImportTestCase):
+    def test_copy_import_matches_the_orm_summary(self):
+        Email.objects.create(email="ann@example.com", first_name="Kept")
+        rows = [
+            ["ann@example.com", "Ann", ""],
+            ["bob@example.com", 'Bob "B", Jr', "O'Neil"],
+            ["bob@example.com", "Second", ""],
+            ["not-an-email", "", ""],
+            ["cid@example.com", "", ""],
+        ]
+        summary = import_rows(rows, self.maillist, mode="copy")
+        self.assertEqual(
+            summary,
+            {
+                "rows": 5,
+                "inserted": 2,
+                "existing": 1,
+                "invalid": 1,
+                "duplicates": 1,
+                "samples": [{"row": 4, "value": "not-an-email,,"}],
+            },
+        )
+        bob = Email.objects.get(email="bob@example.com")
+        self.assertEqual((bob.first_name, bob.last_name), ('Bob "B", Jr', "O'Neil"))
+        self.assertEqual(Email.objects.get(email="cid@example.com").first_name, "")
+        self.maillist.refresh_from_db()
+        self.assertEqual(self.maillist.active_count, 3)
+
+        summary = import_rows(rows[:2], self.maillist, mode="copy")
+        self.assertEqual((summary["inserted"], summary["existing"]), (0, 2))
+        self.maillist.refresh_from_db()
+        self.assertEqual(self.maillist.active_count, 3)
+
+    def test_benchmark_imports_each_mode_into_its_own_list(self):
+        path = self.write_file(contacts_csv(5))
+        call_command(
+            "benchmark_import",
+            self.maillist.id,
+            file=path,
+            modes=["orm", "copy"],
+            keep=True,
+            stdout=io.StringIO(),
+        )
+        lists = MailList.objects.filter(user=self.user).exclude(id=self.maillist.id)
+        self.assertEqual(
+            sorted(lists.values_list("description", "active_count")),
+            [("Benchmark copy import", 5), ("Benchmark orm import", 5)],
+        )
+
+
+class ImportJobTests(ImportTestCase):
+    @override_settings(IMPORT_CHUNK_SIZE=2)
+    def test_job_resumes_from_checkpoint_and_discards_file(self):
+        header = "email,first_name,last_name\n"
+        done = "ann@example.com,Ann,\nbroken,Bob,\n"
+        content = header + done + "cid@example.com,Cid,\nbad,Dan,\nemy@example.com,,\n"
+        job = self.create_job(
+            content,
+            byte_offset=len(header + done),
+            rows_done=2,
+            invalid=1,
+            error_samples=[{"row": 2, "value": "broken,Bob,"}],
+        )
+        path = job.file.path
+
+        job = run_import_job(job.id)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual((job.rows_done, job.inserted, job.invalid), (5, 2, 2))
+        self.assertEqual(job.byte_offset, len(content))
+        self.assertEqual(
+            job.error_samples,
+            [{"row": 2, "value": "broken,Bob,"}, {"row": 4, "value": "bad,Dan,"}],
+        )
+        self.assertFalse(Email.objects.filter(email="ann@example.com").exists())
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(IMPORT_CHUNK_SIZE=3)
+    def test_copy_job_checkpoints_each_chunk(self):
+        content = contacts_csv(4) + "bad,,\ncontact0@example.com,,\n"
+        job = self.create_job(content, mode="copy")
+
+        job = run_import_job(job.id)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual(
+            (job.rows_done, job.inserted, job.invalid, job.existing), (6, 4, 1, 1)
+        )
+        self.assertEqual(job.error_samples, [{"row": 5, "value": "bad,,"}])
+        self.maillist.refresh_from_db()
+        self.assertEqual(self.maillist.active_count, 4)
+
+    def test_stale_delivery_stops_at_the_checkpoint_lock(self):
+        job = self.create_job(contacts_csv(2))
+        ImportJob.objects.filter(id=job.id).update(rows_done=2)
+
+        chunks = [([["ann@example.com", "Ann", ""]], 10)]
+        self.assertFalse(import_row_chunks(job, chunks))
+        self.assertFalse(Email.objects.filter(email="ann@example.com").exists())
+
+    def test_failed_job_discards_file(self):
+        job = self.create_job(b"email\n\xff\xfe@example.com\n")
+        path = job.file.path
+
+        job = run_import_job(job.id)
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertIn("Error processing import file", job.error)
+        self.assertFalse(os.path.exists(path))
+
+
+ODS_CONTENT = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    "<office:document-content"
+    ' xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+    ' xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"'
+    ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">'
+    "<office:body><office:spreadsheet>"
+    "<table:table>{}</table:table>"
+    "<table:table><table:table-row><table:table-cell>"
+    "<text:p>other@example.com</text:p>"
+    "</table:table-cell></table:table-row></table:table>"
+    "</office:spreadsheet></office:body></office:document-content>"
+)
+
+
+def ods_row(*cells, repeat=1):
+    return (
+        f'<table:table-row table:number-rows-repeated="{repeat}">'
+        + "".join(cells)
+        + "</table:table-row>"
+    )
+
+
+def ods_cell(text=None, repeat=1):
+    paragraph = "" if text is None else f"<text:p>{text}</text:p>"
+    return (
+        f'<table:table-cell table:number-columns-repeated="{repeat}">'
+        f"{paragraph}</table:table-cell>"
+    )
+
+
+def zip_file(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def ods_file(*rows):
+    return zip_file({"content.xml": ODS_CONTENT.format("".join(rows))})
+
+
+class SpreadsheetImportTests(ImportTestCase):
+    def test_ods_reader_expands_spacing_and_skips_blank_rows(self):
+        content = ods_file(
+            ods_row(ods_cell("Email"), ods_cell("Given Name"), ods_cell("Surname")),
+            ods_row(
+                ods_cell("ann@example.com"),
+                ods_cell('Mary<text:s text:c="3"/>Ann'),
+                ods_cell("Van<text:s/>Dyke<text:tab/>Jr"),
+                ods_cell(repeat=1000),
+            ),
+            ods_row(ods_cell(repeat=1024), repeat=1048000),
+            ods_row(
+                ods_cell("<text:span>bob</text:span>@example.com"),
+                ods_cell(repeat=2),
+                ods_cell("x"),
+            ),
+        )
+        rows = list(iter_spreadsheet_rows(io.BytesIO(content), ".ods"))
+        self.assertEqual(
+            rows,
+            [
+                ["Email", "Given Name", "Surname"],
+                ["ann@example.com", "Mary   Ann", "Van Dyke\tJr"],
+                ["bob@example.com", "", "", "x"],
+            ],
+        )
+
+    def test_ods_job_imports_and_resumes_after_done_rows(self):
+        content = ods_file(
+            ods_row(ods_cell("Email"), ods_cell("First")),
+            ods_row(ods_cell("ann@example.com"), ods_cell("Ann")),
+            ods_row(ods_cell("bob@example.com"), ods_cell("Bob")),
+        )
+        job = self.create_job(content, "contacts.ods", rows_done=1)
+
+        job = run_import_job(job.id)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual((job.rows_done, job.inserted), (2, 1))
+        self.assertEqual(Email.objects.get().email, "bob@example.com")
+        self.assertIsNone(job.total_rows)
+
+    def test_xlsx_job_maps_columns_and_skips_blank_rows(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Surname", "E-mail", "First Name"])
+        sheet.append(["Smith", "ann@example.com", "Ann"])
+        sheet.append([None, None, None])
+        sheet.append([None, "not-an-email", 42])
+        sheet.append(["Jones", "bob@example.com", None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        job = self.create_job(buffer.getvalue(), "contacts.xlsx")
+
+        job = run_import_job(job.id)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual((job.rows_done, job.inserted, job.invalid), (3, 2, 1))
+        self.assertEqual(job.error_samples, [{"row": 2, "value": "not-an-email,42,"}])
+        self.assertEqual(job.total_rows, 4)
+        ann = Email.objects.get(email="ann@example.com")
+        self.assertEqual((ann.first_name, ann.last_name), ("Ann", "Smith"))
+
+    def test_xlsx_eta_is_estimated_from_rows(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["email"])
+        for i in range(4):
+            workbook.active.append([f"contact{i}@example.com"])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        job = self.create_job(buffer.getvalue(), "contacts.xlsx")
+
+        etas = []
+
+        def checkpoint(*args):
+            save_checkpoint(*args)
+            etas.append(ImportJob.objects.get(id=job.id).eta)
+
+        with override_settings(IMPORT_CHUNK_SIZE=1), mock.patch(
+            "core.importers.save_checkpoint", side_effect=checkpoint
+        ):
+            run_import_job(job.id)
+
+        self.assertEqual(len(etas), 4)
+        self.assertTrue(all(eta is not None for eta in etas))
+        self.assertEqual(etas[-1], 0)
+
+    def test_archives_missing_their_sheet_fail_the_job(self):
+        for name in ("contacts.ods", "contacts.xlsx"):
+            job = self.create_job(zip_file({"other.xml": "<a/>"}), name)
+            job = run_import_job(job.id)
+            self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+            self.assertIn("Error processing import file", job.error)
+
+
+class ShardedImportTests(ImportTestCase):
+    def test_split_ranges_cover_the_file_at_line_starts(self):
+        data = contacts_csv(40).encode()
+        path = self.write_file(data)
+        start = data.index(b"\n") + 1
+
+        ranges = split_ranges(path, start, 100)
+        self.assertGreater(len(ranges), 1)
+        self.assertEqual(ranges[0][0], start)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1 : end], b"\n")
+
+    def test_parse_range_normalizes_and_samples_rows(self):
+        path = self.write_file(
+            "Ann,ann@example.com\n"
+            "Bob,not-an-email\n"
+            "Ann again,ann@example.com\n"
+            "Cid,cid@example.com\n"
+        )
+        shard = parse_range(
+            path, 0, os.path.getsize(path), columns=(1, 0, None), sample_limit=5
+        )
+        self.assertFalse(shard["multiline"])
+        self.assertEqual(
+            shard["contacts"],
+            [("ann@example.com", "Ann", ""), ("cid@example.com", "Cid", "")],
+        )
+        self.assertEqual(
+            (shard["rows"], shard["invalid"], shard["duplicates"]), (4, 1, 1)
+        )
+        self.assertEqual(shard["samples"], [{"row": 2, "value": "not-an-email,Bob,"}])
+
+    def test_parse_range_flags_quoted_newlines(self):
+        path = self.write_file('a@example.com,"First\nLine",Last\n')
+        shard = parse_range(path, 0, os.path.getsize(path))
+        self.assertTrue(shard["multiline"])
+
+        path = self.write_file('a@example.com,"Say ""hi""",Last\n', "quotes.csv")
+        self.assertFalse(parse_range(path, 0, os.path.getsize(path))["multiline"])
+
+    def test_merge_shards_dedupes_across_batches(self):
+        def shard(emails, rows):
+            return {
+                "contacts": [(email, "", "") for email in emails],
+                "rows": rows,
+                "invalid": rows - len(emails),
+                "duplicates": 0,
+                "samples": [{"row": 1, "value": "bad"}] if rows > len(emails) else [],
+            }
+
+        seen = set()
+        samples = []
+        contacts, summary = merge_shards(
+            [shard(["a@example.com", "b@example.com"], 3), shard(["a@example.com"], 1)],
+            1,
+            samples,
+            10,
+            seen,
+        )
+        self.assertEqual(list(contacts), ["a@example.com", "b@example.com"])
+        self.assertEqual((summary["rows"], summary["duplicates"]), (4, 1))
+
+        contacts, summary = merge_shards(
+            [shard(["b@example.com", "c@example.com"], 3)], 5, samples, 10, seen
+        )
+        self.assertEqual(list(contacts), ["c@example.com"])
+        self.assertEqual((summary["invalid"], summary["duplicates"]), (1, 1))
+        self.assertEqual(
+            samples, [{"row": 1, "value": "bad"}, {"row": 5, "value": "bad"}]
+        )
+
+    @override_settings(IMPORT_SHARD_BYTES=64)
+    def test_quoted_newlines_fall_back_to_serial_import(self):
+        content = contacts_csv(10) + 'multi@example.com,"Two\nLines",Last\n'
+        job = self.create_job(content, workers=2)
+
+        job = run_import_job(job.id)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual(job.workers, 1)
+        self.assertEqual((job.rows_done, job.inserted, job.invalid), (11, 11, 0))
+        self.assertEqual(
+            Email.objects.get(email="multi@example.com").first_name, "Two\nLines"
+        )
+
+
+class MemberCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        cls.first = MailList.objects.create(user=cls.user)
+        cls.second = MailList.objects.create(user=cls.user)
+        cls.ann, cls.bob = Email.objects.bulk_create(
+            [Email(email="ann@example.com"), Email(email="bob@example.com")]
+        )
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def assertCounts(self, maillist, active, unsubscribed):
+        maillist.refresh_from_db(fields=["active_count", "unsubscribed_count"])
+        self.assertEqual(
+            (maillist.active_count, maillist.unsubscribed_count),
+            (active, unsubscribed),
+        )
+
+    def test_signals_follow_create_unsubscribe_and_move(self):
+        member = EmailMailList.objects.create(email=self.ann, maillist=self.first)
+        EmailMailList.objects.create(email=self.bob, maillist=self.first)
+        self.assertCounts(self.first, 2, 0)
+
+        EmailMailList.objects.get(id=member.id).unsubscribe()
+        self.assertCounts(self.first, 1, 1)
+
+        member = EmailMailList.objects.get(id=member.id)
+        member.maillist = self.second
+        member.save()
+        self.assertCounts(self.first, 1, 0)
+        self.assertCounts(self.second, 0, 1)
+
+        member.save()
+        self.assertCounts(self.second, 0, 1)
+
+    def test_deletes_through_the_api_count_members_out(self):
+        member = EmailMailList.objects.create(email=self.ann, maillist=self.first)
+        EmailMailList.objects.create(email=self.ann, maillist=self.second)
+        EmailMailList.objects.create(
+            email=self.bob, maillist=self.second, unsubscribed_at=timezone.now()
+        )
+
+        response = self.client.delete(f"/core/api/email-mail-list/{member.id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertCounts(self.first, 0, 0)
+
+        response = self.client.delete(f"/core/api/emails/{self.bob.id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertCounts(self.second, 1, 0)
+
+    def test_reconcile_repairs_drifted_counts(self):
+        EmailMailList.objects.bulk_create(
+            [
+                EmailMailList(email=self.ann, maillist=self.first),
+                EmailMailList(
+                    email=self.bob, maillist=self.first, unsubscribed_at=timezone.now()
+                ),
+            ]
+        )
+        MailList.objects.filter(id=self.second.id).update(active_count=3)
+        self.assertCounts(self.first, 0, 0)
+
+        self.assertEqual(reconcile_member_counts(), 2)
+        self.assertCounts(self.first, 1, 1)
+        self.assertCounts(self.second, 0, 0)
+        self.assertEqual(reconcile_member_counts(), 0)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        emails = Email.objects.bulk_create(
+            Email(email=f"contact{i}@example.com") for i in range(5)
+        )
+        # Rows sharing a timestamp are ordered by id.
+        Email.objects.filter(id__in=[email.id for email in emails[1:4]]).update(
+            created_at=emails[1].created_at
+        )
+        cls.newest_first = [email.email for email in reversed(emails)]
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        emails = [email["email"] for email in response.data["results"]]
+        return emails, response.data["next"], response.data["previous"]
+
+    def test_next_and_previous_links_walk_every_row_once(self):
+        first, next_url, previous_url = self.page("/core/api/emails/", page_size=2)
+        self.assertEqual(first, self.newest_first[:2])
+        self.assertIsNone(previous_url)
+
+        second, next_url, _ = self.page(next_url)
+        self.assertEqual(second, self.newest_first[2:4])
+        last, end, previous_url = self.page(next_url)
+        self.assertEqual(last, self.newest_first[4:])
+        self.assertIsNone(end)
+
+        back, _, previous_url = self.page(previous_url)
+        self.assertEqual(back, self.newest_first[2:4])
+        start, _, previous_url = self.page(previous_url)
+        self.assertEqual(start, self.newest_first[:2])
+        self.assertIsNone(previous_url)
+
+    @override_settings(PAGINATION_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        emails, _, _ = self.page("/core/api/emails/", page_size=50)
+        self.assertEqual(emails, self.newest_first[:3])
+        emails, _, _ = self.page("/core/api/emails/", page_size=0)
+        self.assertEqual(emails, self.newest_first[:1])
+        emails, _, _ = self.page("/core/api/emails/", page_size="many")
+        self.assertEqual(emails, self.newest_first[:3])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get("/core/api/emails/", {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        cls.maillist = MailList.objects.create(user=cls.user)
+        cls.ann, cls.bob = Email.objects.bulk_create(
+            [
+                Email(email="ann@example.com", first_name="Ann", last_name="Lee, Jr"),
+                Email(email="bob@example.com", first_name="Bob"),
+            ]
+        )
+        cls.unsubscribed_at = timezone.now()
+        EmailMailList.objects.bulk_create(
+            [
+                EmailMailList(email=cls.ann, maillist=cls.maillist),
+                EmailMailList(
+                    email=cls.bob,
+                    maillist=cls.maillist,
+                    unsubscribed_at=cls.unsubscribed_at,
+                ),
+            ]
+        )
+        cls.campaign = Campaign.objects.create(
+            user=cls.user, name="Launch", description="Launch"
+        )
+        cls.campaign.maillists.add(cls.maillist)
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def export(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        return response, chunks
+
+    @override_settings(EXPORT_CHUNK_SIZE=1)
+    def test_maillist_csv_streams_one_chunk_per_batch(self):
+        response, chunks = self.export(
+            f"/core/api/mail-lists/{self.maillist.id}/export/"
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="maillist-{self.maillist.id}.csv"',
+        )
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO("".join(chunks))))
+        self.assertEqual(
+            rows[0],
+            ["email", "first_name", "last_name", "subscribed_at", "unsubscribed_at"],
+        )
+        self.assertEqual(rows[1][:3], ["ann@example.com", "Ann", "Lee, Jr"])
+        self.assertEqual(rows[1][4], "")
+        self.assertEqual(rows[2][4], self.unsubscribed_at.isoformat())
+
+    def test_maillist_ndjson_encodes_one_object_per_line(self):
+        response, chunks = self.export(
+            f"/core/api/mail-lists/{self.maillist.id}/export/", fmt="ndjson"
+        )
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = "".join(chunks).splitlines()
+        members = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [member["email"] for member in members],
+            ["ann@example.com", "bob@example.com"],
+        )
+        self.assertIsNone(members[0]["unsubscribed_at"])
+        self.assertIsNotNone(members[1]["unsubscribed_at"])
+
+    def test_campaign_export_streams_the_active_audience(self):
+        _, chunks = self.export(f"/core/api/campaigns/{self.campaign.id}/export/")
+        self.assertEqual(
+            "".join(chunks),
+            'email,first_name,last_name\r\nann@example.com,Ann,"Lee, Jr"\r\n',
+        )
+
+    def test_unsupported_format_and_foreign_lists_are_rejected(self):
+        response = self.client.get(
+            f"/core/api/mail-lists/{self.maillist.id}/export/", {"fmt": "xml"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Unsupported export format: xml"})
+
+        other = create_user("other@example.com", "Other")
+        response = auth_client(other).get(
+            f"/core/api/campaigns/{self.campaign.id}/export/"
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class CampaignAudienceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        cls.first, cls.second = MailList.objects.bulk_create(
+            [MailList(user=cls.user), MailList(user=cls.user)]
+        )
+        cls.ann, cls.bob, cls.cid = Email.objects.bulk_create(
+            Email(email=f"{name}@example.com") for name in ("ann", "bob", "cid")
+        )
+        EmailMailList.objects.bulk_create(
+            [
+                EmailMailList(email=cls.ann, maillist=cls.first),
+                EmailMailList(email=cls.bob, maillist=cls.first),
+                EmailMailList(email=cls.bob, maillist=cls.second),
+                EmailMailList(
+                    email=cls.cid, maillist=cls.second, unsubscribed_at=timezone.now()
+                ),
+            ]
+        )
+        cls.campaign = Campaign.objects.create(
+            user=cls.user, name="Launch", description="Launch"
+        )
+        cls.campaign.maillists.add(cls.first, cls.second)
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+        response = self.client.post(
+            f"/core/api/campaigns/{self.campaign.id}/freeze-audience/"
+        )
+        self.assertEqual(response.data["recipient_count"], 2)
+
+    def assertRecipients(self, *emails):
+        self.campaign.refresh_from_db(fields=["recipient_count"])
+        recipients = CampaignRecipient.objects.filter(campaign=self.campaign)
+        self.assertEqual(
+            sorted(recipients.values_list("email__email", flat=True)), sorted(emails)
+        )
+        self.assertEqual(self.campaign.recipient_count, len(emails))
+
+    def test_freeze_materializes_active_members(self):
+        self.assertRecipients("ann@example.com", "bob@example.com")
+
+    def test_membership_writes_update_the_frozen_audience(self):
+        self.client.post(
+            "/core/api/email-mail-list/",
+            {"email": "cid@example.com", "maillist": self.first.id},
+        )
+        self.assertRecipients("ann@example.com", "bob@example.com", "cid@example.com")
+
+        bob_first = EmailMailList.objects.get(email=self.bob, maillist=self.first)
+        response = self.client.patch(
+            f"/core/api/email-mail-list/{bob_first.id}/",
+            {"unsubscribed_at": timezone.now().isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        # Still subscribed through the second list.
+        self.assertRecipients("ann@example.com", "bob@example.com", "cid@example.com")
+
+        bob_second = EmailMailList.objects.get(email=self.bob, maillist=self.second)
+        self.client.delete(f"/core/api/email-mail-list/{bob_second.id}/")
+        self.assertRecipients("ann@example.com", "cid@example.com")
+
+        ann_first = EmailMailList.objects.get(email=self.ann, maillist=self.first)
+        self.client.patch(
+            f"/core/api/email-mail-list/{ann_first.id}/",
+            {"unsubscribed_at": timezone.now().isoformat()},
+        )
+        self.assertRecipients("cid@example.com")
+
+    def test_model_unsubscribe_prunes_the_frozen_audience(self):
+        EmailMailList.objects.get(email=self.ann, maillist=self.first).unsubscribe()
+        self.assertRecipients("bob@example.com")
+
+    def test_direct_saves_keep_the_frozen_audience_in_step(self):
+        member = EmailMailList.objects.get(email=self.bob, maillist=self.second)
+        member.maillist = MailList.objects.create(user=self.user)
+        member.save()
+        # Still subscribed through the first list.
+        self.assertRecipients("ann@example.com", "bob@example.com")
+
+        member = EmailMailList.objects.get(email=self.bob, maillist=self.first)
+        member.maillist = MailList.objects.create(user=self.user)
+        member.save()
+        self.assertRecipients("ann@example.com")
+
+        EmailMailList.objects.create(email=self.cid, maillist=self.first)
+        self.assertRecipients("ann@example.com", "cid@example.com")
+
+    def test_deleting_an_email_counts_out_its_recipients(self):
+        self.client.delete(f"/core/api/emails/{self.ann.id}/")
+        self.assertRecipients("bob@example.com")
+
+    def test_unlinking_a_list_prunes_its_members(self):
+        self.campaign.maillists.remove(self.first)
+        self.assertRecipients("bob@example.com")
+
+
+@override_settings(RESPONSE_CACHE_TTL=0)
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        cls.seeded = 0
+        cls.maillist, cls.campaign = cls.seed(cls.user, 2)
+        cls.email = Email.objects.create(email="new@example.com")
+        cls.member = EmailMailList.objects.filter(maillist=cls.maillist).first()
+        cls.template = EmailTemplate.objects.filter(user=cls.user).first()
+        cls.job = ImportJob.objects.filter(user=cls.user).first()
+
+    @classmethod
+    def seed(cls, user, count):
+        start = cls.seeded
+        cls.seeded += count
+        maillists = MailList.objects.bulk_create(
+            MailList(user=user, description=f"List {i}")
+            for i in range(start, cls.seeded)
+        )
+        emails = Email.objects.bulk_create(
+            Email(email=f"seed{i}@example.com") for i in range(start, cls.seeded)
+        )
+        EmailMailList.objects.bulk_create(
+            EmailMailList(email=email, maillist=maillist)
+            for email in emails
+            for maillist in maillists
+        )
+        campaigns = Campaign.objects.bulk_create(
+            Campaign(user=user, name=f"Campaign {i}") for i in range(start, cls.seeded)
+        )
+        for campaign in campaigns:
+            campaign.maillists.add(*maillists)
+        Attachment.objects.bulk_create(
+            Attachment(campaign=campaign, file=f"media/attachments/{campaign.id}.pdf")
+            for campaign in campaigns
+            for _ in range(2)
+        )
+        OutgoingMails.objects.bulk_create(
+            OutgoingMails(
+                campaign=campaign,
+                user=user,
+                sender=user.email,
+                to=email.email,
+                status="sent",
+            )
+            for campaign in campaigns
+            for email in emails
+        )
+        EmailTemplate.objects.bulk_create(
+            EmailTemplate(user=user, name=f"Template {i}", html_content="<p></p>")
+            for i in range(start, cls.seeded)
+        )
+        ImportJob.objects.bulk_create(
+            ImportJob(user=user, maillist=maillist, file="imports/contacts.csv")
+            for maillist in maillists
+        )
+        return maillists[0], campaigns[0]
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def grow(self):
+        self.seed(self.user, 5)
+
+    def test_email_endpoints(self):
+        self.assertQueryBudget(self.client, 1, "/core/api/emails/", grow=self.grow)
+        self.assertQueryBudget(self.client, 1, f"/core/api/emails/{self.email.id}/")
+        self.assertQueryBudget(
+            self.client,
+            2,
+            "/core/api/emails/",
+            method="post",
+            data={"email": "created@example.com"},
+        )
+        self.assertQueryBudget(
+            self.client,
+            3,
+            f"/core/api/emails/{self.email.id}/",
+            method="put",
+            data={"email": self.email.email, "first_name": "New"},
+        )
+        self.assertQueryBudget(
+            self.client, 8, f"/core/api/emails/{self.email.id}/", method="delete"
+        )
+
+    def test_maillist_endpoints(self):
+        self.assertQueryBudget(self.client, 2, "/core/api/mail-lists/", grow=self.grow)
+        self.assertQueryBudget(
+            self.client, 2, f"/core/api/mail-lists/{self.maillist.id}/"
+        )
+        self.assertQueryBudget(
+            self.client,
+            2,
+            f"/core/api/mail-lists/{self.maillist.id}/export/",
+            grow=self.grow,
+        )
+        self.assertQueryBudget(
+            self.client,
+            1,
+            "/core/api/mail-lists/",
+            method="post",
+            data={"description": "Created"},
+        )
+        self.assertQueryBudget(
+            self.client,
+            2,
+            f"/core/api/mail-lists/{self.maillist.id}/",
+            method="put",
+            data={"description": "Renamed"},
+        )
+        self.assertQueryBudget(
+            self.client,
+            7,
+            f"/core/api/mail-lists/{self.maillist.id}/",
+            method="delete",
+        )
+
+    def test_email_maillist_endpoints(self):
+        self.assertQueryBudget(
+            self.client, 1, "/core/api/email-mail-list/", grow=self.grow
+        )
+        self.assertQueryBudget(
+            self.client, 1, f"/core/api/email-mail-list/{self.member.id}/"
+        )
+        self.assertQueryBudget(
+            self.client,
+            8,
+            "/core/api/email-mail-list/",
+            method="post",
+            data={"email": self.email.email, "maillist": self.maillist.id},
+        )
+        self.assertQueryBudget(
+            self.client,
+            8,
+            f"/core/api/email-mail-list/{self.member.id}/",
+            method="put",
+            data={"email": self.member.email.email, "maillist": self.maillist.id},
+        )
+        self.assertQueryBudget(
+            self.client,
+            6,
+            f"/core/api/email-mail-list/{self.member.id}/",
+            method="delete",
+        )
+
+    def test_campaign_endpoints(self):
+        self.assertQueryBudget(self.client, 4, "/core/api/campaigns/", grow=self.grow)
+        self.assertQueryBudget(
+            self.client, 4, f"/core/api/campaigns/{self.campaign.id}/"
+        )
+        self.assertQueryBudget(
+            self.client,
+            2,
+            f"/core/api/campaigns/{self.campaign.id}/export/",
+            grow=self.grow,
+        )
+        self.assertQueryBudget(
+            self.client, 2, f"/core/api/campaigns/{self.campaign.id}/progress/"
+        )
+        self.assertQueryBudget(
+            self.client,
+            7,
+            f"/core/api/campaigns/{self.campaign.id}/freeze-audience/",
+            method="post",
+        )
+        self.assertQueryBudget(
+            self.client,
+            2,
+            f"/core/api/get-all-campaign-mails/{self.campaign.id}/",
+            grow=self.grow,
+        )
+        self.assertQueryBudget(
+            self.client,
+            5,
+            "/core/api/delete-mails/",
+            method="delete",
+            data={"campaign": self.campaign.id},
+        )
+
+    def test_campaign_writes(self):
+        self.assertQueryBudget(
+            self.client,
+            13,
+            "/core/api/campaigns/",
+            method="post",
+            data={
+                "name": "Created",
+                "description": "Created",
+                "maillists": [self.maillist.id],
+            },
+        )
+        self.assertQueryBudget(
+            self.client,
+            13,
+            f"/core/api/campaigns/{self.campaign.id}/",
+            method="put",
+            data={
+                "name": self.campaign.name,
+                "description": "Renamed",
+                "subject": "Hello",
+                "maillists": [self.maillist.id],
+            },
+        )
+        self.assertQueryBudget(
+            self.client,
+            6,
+            f"/core/api/campaigns/{self.campaign.id}/",
+            method="patch",
+            data={"description": "Updated"},
+        )
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root):
+            self.assertQueryBudget(
+                self.client,
+                4,
+                f"/core/api/campaigns/{self.campaign.id}/add_attachment/",
+                method="post",
+                data={"file": ContentFile(b"%PDF-1.4", name="brochure.pdf")},
+                format="multipart",
+            )
+        self.assertQueryBudget(
+            self.client,
+            12,
+            f"/core/api/campaigns/{self.campaign.id}/",
+            method="delete",
+        )
+
+    def test_template_endpoints(self):
+        self.assertQueryBudget(self.client, 2, "/core/api/templates/", grow=self.grow)
+        self.assertQueryBudget(
+            self.client, 2, f"/core/api/templates/{self.template.id}/"
+        )
+        self.assertQueryBudget(
+            self.client,
+            2,
+            "/core/api/templates/",
+            method="post",
+            data={"name": "Created", "html_content": "<p>Hi</p>"},
+        )
+        self.assertQueryBudget(
+            self.client,
+            3,
+            f"/core/api/templates/{self.template.id}/",
+            method="put",
+            data={"name": "Renamed", "html_content": "<p>Hello</p>"},
+        )
+        self.assertQueryBudget(
+            self.client,
+            3,
+            f"/core/api/templates/{self.template.id}/",
+            method="delete",
+        )
+
+    def test_import_job_endpoints(self):
+        self.assertQueryBudget(self.client, 1, "/core/api/import-jobs/", grow=self.grow)
+        self.assertQueryBudget(self.client, 1, f"/core/api/import-jobs/{self.job.id}/")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    RESPONSE_CACHE_TTL=60,
+)
+class ResponseCacheTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        cls.other = create_user("other@example.com", "Other")
+        cls.template = EmailTemplate.objects.create(
+            user=cls.user, name="Welcome", html_content="<p>Hi</p>"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = auth_client(self.user)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        path = f"/core/api/templates/{self.template.id}/"
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+        response = self.assertQueryBudget(self.client, 0, path)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["name"], "Welcome")
+        self.assertEqual(
+            get_stats(["templates"])["templates"], {"hits": 1, "misses": 1}
+        )
+
+    def test_cache_hits_answer_conditional_requests(self):
+        path = f"/core/api/templates/{self.template.id}/"
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+
+    def test_cache_is_per_user(self):
+        self.client.get("/core/api/templates/")
+        response = auth_client(self.other).get("/core/api/templates/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"], [])
+
+    def test_saving_invalidates_cached_responses(self):
+        path = f"/core/api/templates/{self.template.id}/"
+        self.client.get(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template.name = "Renamed"
+            self.template.save()
+
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["name"], "Renamed")
+
+    def test_member_count_updates_invalidate_mail_lists(self):
+        maillist = MailList.objects.create(user=self.user)
+        email = Email.objects.create(email="contact@example.com")
+        self.client.get("/core/api/mail-lists/")
+        with self.captureOnCommitCallbacks(execute=True):
+            EmailMailList.objects.create(email=email, maillist=maillist)
+
+        response = self.client.get("/core/api/mail-lists/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["active_count"], 1)
+
+    def test_attachments_invalidate_campaigns(self):
+        campaign = Campaign.objects.create(
+            user=self.user, name="Launch", description="Launch"
+        )
+        path = f"/core/api/campaigns/{campaign.id}/"
+        self.client.get(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            Attachment.objects.create(
+                campaign=campaign, file="media/attachments/brochure.pdf"
+            )
+
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.data["attachments"]), 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    RESPONSE_CACHE_TTL=0,
+)
+class ConditionalGetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("owner@example.com", "Owner")
+        cls.campaign = Campaign.objects.create(
+            user=cls.user, name="Launch", description="Launch", body="<p>Hi</p>"
+        )
+        cls.maillist = MailList.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = auth_client(self.user)
+
+    def test_unchanged_resources_are_not_modified(self):
+        for path in (
+            "/core/api/campaigns/",
+            f"/core/api/campaigns/{self.campaign.id}/",
+        ):
+            response = self.client.get(path)
+            self.assertNotIn("Last-Modified", response)
+
+            with self.assertNumQueries(1):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_never_hides_counter_updates(self):
+        path = f"/core/api/mail-lists/{self.maillist.id}/"
+        member = EmailMailList.objects.create(
+            email=Email.objects.create(email="contact@example.com"),
+            maillist=self.maillist,
+        )
+        self.client.get(path)
+        since = http_date(time.time() + 3600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            member.unsubscribe()
+        response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data["active_count"], response.data["unsubscribed_count"]),
+            (0, 1),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_rows([["new@example.com", "", ""]], self.maillist)
+        response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["active_count"], 1)
+
+    def test_changes_produce_a_new_etag(self):
+        path = f"/core/api/campaigns/{self.campaign.id}/"
+        etag = self.client.get(path)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.campaign.maillists.add(self.maillist)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["maillists"], [self.maillist.id])
+
+        path = f"/core/api/mail-lists/{self.maillist.id}/"
+        etag = self.client.get(path)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            EmailMailList.objects.create(
+                email=Email.objects.create(email="contact@example.com"),
+                maillist=self.maillist,
+            )
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["active_count"], 1)
+
+    def test_missing_objects_still_return_404(self):
+        response = self.client.get("/core/api/campaigns/0/")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/core/api/campaigns/abc/")
+        self.assertEqual(response.status_code, 404)
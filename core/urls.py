@@ -7,8 +7,10 @@ from .views import (
     EmailMailListViewSet,
     CampaignViewSet,
     GetAllCampaignMails,
+    ImportJobViewSet,
     CreateSendPendingMails,
     DeleteMailsView,
+    SendProgressView,
     TemplateViewSet,
 )
 
@@ -18,6 +20,7 @@ router.register(r"mail-lists", MailListViewSet, basename="maillist")
 router.register(r"email-mail-list", EmailMailListViewSet, basename="emailmaillist")
 router.register(r"campaigns", CampaignViewSet, basename="campaign")
 router.register(r"templates", TemplateViewSet, basename="template")
+router.register(r"import-jobs", ImportJobViewSet, basename="importjob")
 
 urlpatterns = [
     path("api/", include(router.urls)),
@@ -32,5 +35,10 @@ urlpatterns = [
         CreateSendPendingMails.as_view(),
         name="create-send-pending-mails",
     ),
+    path(
+        "api/send-progress/<str:task_id>/",
+        SendProgressView.as_view(),
+        name="send-progress",
+    ),
     path("api/delete-mails/", DeleteMailsView.as_view(), name="delete-mails"),
 ]
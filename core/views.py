@@ -1,5 +1,6 @@
-from django.db.models import Q
+from celery.result import AsyncResult
 from django.db import transaction
+from django.db.models import Count, Q
 from django.core.exceptions import ObjectDoesNotExist
 
 from rest_framework import generics, status, viewsets, parsers, views
@@ -16,6 +17,7 @@ from .models import (
     Campaign,
     OutgoingMails,
     EmailTemplate,
+    ImportJob,
 )
 from .serializers import (
     EmailSerializer,
@@ -26,8 +28,22 @@ from .serializers import (
     CampaignSerializer,
     EmailTemplateSerializer,
     AttachmentSerializer,
+    ImportJobSerializer,
 )
-from .tasks import send_mail_task
+from .audience import (
+    freeze_audience,
+    prune_recipients,
+    remove_email_recipients,
+    unfreeze_audience,
+)
+from .caching import CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .exports import EXPORT_FORMATS, export_response
+from .members import count_removed_members
+from .outbox import enqueue
+from .pagination import KeysetPagination
+from .stats import counters, get_campaign_stats, transition_deltas
+from .tasks import fan_out_campaign_task, import_contacts_task
 
 
 class GetAllCampaignMails(views.APIView):
@@ -48,20 +64,17 @@ class GetAllCampaignMails(views.APIView):
             )
 
         try:
-            campaign = Campaign.objects.get(id=campaign_id)
+            campaign = Campaign.objects.get(id=campaign_id, user=request.user)
         except ObjectDoesNotExist:
             return Response(
                 {"error": "Campaign does not exist"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        emails = campaign.get_all_emails()
-        if emails is None:
-            return Response(
-                {"error": "No emails found for this campaign"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        return Response({"emails": emails}, status=status.HTTP_200_OK)
+        paginator = KeysetPagination()
+        emails = paginator.paginate_queryset(
+            campaign.get_audience().only("id", "email", "created_at"), request, self
+        )
+        return paginator.get_paginated_response([email.email for email in emails])
 
 
 class EmailViewSet(viewsets.ModelViewSet):
@@ -69,6 +82,17 @@ class EmailViewSet(viewsets.ModelViewSet):
     serializer_class = EmailSerializer
     permission_classes = [IsAuthenticated, HasCompleteProfile]
 
+    def perform_destroy(self, instance):
+        # Memberships cascade with the email, so they are counted out here
+        # rather than in a delete signal that would disable fast deletes.
+        memberships = EmailMailList.objects.filter(email=instance).values_list(
+            "maillist_id", "unsubscribed_at"
+        )
+        with transaction.atomic():
+            remove_email_recipients([instance.id])
+            count_removed_members(memberships)
+            instance.delete()
+
 
 class AddBulkEmailView(generics.CreateAPIView):
     serializer_class = BulkAddEmailSerializer
@@ -95,21 +119,32 @@ class AddBulkEmailView(generics.CreateAPIView):
             )
 
         serializer = self.get_serializer(
-            data={"csv_file": csv_file, "maillist": maillist}
+            data={"csv_file": csv_file, "maillist": maillist.id}
         )
         if serializer.is_valid():
-            serializer.save(maillist=maillist)
+            with transaction.atomic():
+                job = serializer.save(user=request.user)
+                enqueue(import_contacts_task, job.id)
             return Response(
-                {"success": "Emails have been added successfully"},
-                status=status.HTTP_201_CREATED,
+                ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MailListViewSet(viewsets.ModelViewSet):
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated, HasCompleteProfile]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
+
+class MailListViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = MailList.objects.all()
     serializer_class = MailListSerializer
     permission_classes = [IsAuthenticated, HasCompleteProfile]
+    cache_resource = "maillists"
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -117,6 +152,26 @@ class MailListViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return MailList.objects.filter(user=self.request.user)
 
+    @action(detail=True, methods=["get"])
+    def export(self, request, pk=None):
+        maillist = self.get_object()
+        fmt = request.query_params.get("fmt", "csv")
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported export format: {fmt}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        members = EmailMailList.objects.filter(maillist=maillist).order_by("id")
+        fields = {
+            "email": "email__email",
+            "first_name": "email__first_name",
+            "last_name": "email__last_name",
+            "subscribed_at": "created_at",
+            "unsubscribed_at": "unsubscribed_at",
+        }
+        return export_response(members, fields, fmt, f"maillist-{maillist.id}")
+
 
 class EmailMailListViewSet(viewsets.ModelViewSet):
     queryset = EmailMailList.objects.all()
@@ -124,22 +179,84 @@ class EmailMailListViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, HasCompleteProfile]
 
     def get_queryset(self):
-        return EmailMailList.objects.filter(maillist__user=self.request.user)
+        return EmailMailList.objects.filter(
+            maillist__user=self.request.user
+        ).select_related("email")
 
+    # The post_save receiver keeps member counts and campaign recipients in
+    # step with saved memberships.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            count_removed_members([(instance.maillist_id, instance.unsubscribed_at)])
+            prune_recipients(
+                maillist_ids=[instance.maillist_id], email_ids=[instance.email_id]
+            )
 
-class CampaignViewSet(viewsets.ModelViewSet):
+
+class CampaignViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Campaign.objects.all()
     serializer_class = CampaignSerializer
     permission_classes = [IsAuthenticated, HasCompleteProfile]
+    cache_resource = "campaigns"
 
     def perform_create(self, serializer):
-        user = self.request.user
-        serializer.save(user=user)
-        return super().perform_create(serializer)
+        serializer.save(user=self.request.user)
 
     def get_queryset(self):
-        return Campaign.objects.filter(user=self.request.user).prefetch_related(
-            "maillists"
+        queryset = Campaign.objects.filter(user=self.request.user)
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.prefetch_related("maillists", "attachments")
+        return queryset
+
+    @action(detail=True, methods=["get"])
+    def export(self, request, pk=None):
+        campaign = self.get_object()
+        fmt = request.query_params.get("fmt", "csv")
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported export format: {fmt}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        audience = campaign.get_audience().order_by("id")
+        fields = {
+            "email": "email",
+            "first_name": "first_name",
+            "last_name": "last_name",
+        }
+        return export_response(audience, fields, fmt, f"campaign-{campaign.id}")
+
+    @action(detail=True, methods=["post", "delete"], url_path="freeze-audience")
+    def freeze_audience(self, request, pk=None):
+        campaign = self.get_object()
+        if request.method == "DELETE":
+            unfreeze_audience(campaign)
+        else:
+            freeze_audience(campaign)
+        return Response(
+            {
+                "campaign": campaign.id,
+                "audience_frozen_at": campaign.audience_frozen_at,
+                "recipient_count": campaign.recipient_count,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=True, methods=["get"])
+    def progress(self, request, pk=None):
+        campaign = self.get_object()
+        return Response(
+            {"campaign": campaign.id, **get_campaign_stats(campaign.id)},
+            status=status.HTTP_200_OK,
         )
 
     @action(detail=True, methods=["post"])
@@ -157,10 +274,11 @@ class CampaignViewSet(viewsets.ModelViewSet):
         )
 
 
-class TemplateViewSet(viewsets.ModelViewSet):
+class TemplateViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = EmailTemplate.objects.all()
     serializer_class = EmailTemplateSerializer
     permission_classes = [IsAuthenticated, HasCompleteProfile]
+    cache_resource = "templates"
 
     def get_queryset(self):
         return EmailTemplate.objects.filter(user=self.request.user)
@@ -189,9 +307,14 @@ class DeleteMailsView(views.APIView):
             )
 
         status_list = request.data.get("status", ["sent", "failed"])
-        OutgoingMails.objects.filter(
+        mails = OutgoingMails.objects.filter(
             Q(status__in=status_list) & Q(campaign=campaign_id) & Q(user=request.user)
-        ).delete()
+        )
+        deleted = list(
+            mails.values("campaign_id", "status").annotate(count=Count("id"))
+        )
+        mails.delete()
+        counters.incr(transition_deltas(deleted))
 
         return Response({"message": "All selected mails have been deleted"})
 
@@ -202,49 +325,48 @@ class CreateSendPendingMails(generics.CreateAPIView):
 
     def create(self, request):
         campaign_id = request.data.get("campaign")
-        user = request.user
 
-        try:
-            campaign = Campaign.objects.get(id=campaign_id, user=request.user)
-        except Campaign.DoesNotExist:
+        if not Campaign.objects.filter(id=campaign_id, user=request.user).exists():
             return Response(
                 {"error": "Campaign does not exist or you do not have access to it"},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        emails = campaign.get_all_emails()
-        total_emails = len(emails)
+        message = enqueue(fan_out_campaign_task, int(campaign_id))
 
-        bulk_mails = []
-        for email in emails:
-            mail_data = {
-                "campaign": campaign,
-                "user": request.user,
-                "to": email,
-                "sender": user.smtp_creds.username,
-                "status": "queued",
-            }
-            bulk_mails.append(OutgoingMails(**mail_data))
+        return Response(
+            {
+                "message": "Campaign emails are being queued for sending",
+                "task_id": message.task_id,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        try:
-            with transaction.atomic():
-                created_mails = OutgoingMails.objects.bulk_create(bulk_mails)
-
-                for mails in created_mails:
-                    send_mail_task.delay(
-                        mails.id,
-                        campaign.subject,
-                        campaign.body,
-                        mails.sender,
-                        mails.to,
-                    )
-        except Exception as e:
+
+class SendProgressView(views.APIView):
+    permission_classes = [IsAuthenticated, HasCompleteProfile]
+
+    def get(self, request, task_id):
+        result = AsyncResult(task_id)
+        if result.state == "PENDING":
             return Response(
-                {"error": f"An error occurred while sending mails: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                {"state": result.state, "queued": 0}, status=status.HTTP_200_OK
+            )
+
+        info = result.info if isinstance(result.info, dict) else {}
+
+        campaign_id = info.get("campaign")
+        if not Campaign.objects.filter(id=campaign_id, user=request.user).exists():
+            return Response(
+                {"error": "Task does not exist or you do not have access to it"},
+                status=status.HTTP_404_NOT_FOUND,
             )
 
         return Response(
-            {"message": f"All {total_emails} emails have been queued for sending"},
-            status=status.HTTP_201_CREATED,
+            {
+                "state": result.state,
+                "campaign": campaign_id,
+                "queued": info.get("queued", 0),
+            },
+            status=status.HTTP_200_OK,
         )
@@ -130,12 +130,25 @@ REST_FRAMEWORK = {
         # "rest_framework.renderers.BrowsableAPIRenderer",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "account.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": {
         "rest_framework.permissions.IsAuthenticated",
     },
+    "DEFAULT_PAGINATION_CLASS": "core.pagination.KeysetPagination",
+    "PAGE_SIZE": int(os.environ.get("PAGE_SIZE", 100)),
 }
+PAGINATION_MAX_PAGE_SIZE = int(os.environ.get("PAGINATION_MAX_PAGE_SIZE", 1000))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_URL", "redis://redis:6379/1"),
+    }
+}
+# List and detail responses of campaigns, mail lists and templates are cached
+# per user for RESPONSE_CACHE_TTL seconds. Set it to 0 to disable the cache.
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=30),
@@ -145,6 +158,13 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
+# Authenticated users, with a flag for whether they have SMTP credentials, are
+# cached per process for AUTH_CACHE_TTL seconds. When AUTH_CACHE_REDIS_URL is
+# set they are also shared between processes through Redis.
+AUTH_CACHE_TTL = int(os.environ.get("AUTH_CACHE_TTL", 30))
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_REDIS_URL = os.environ.get("AUTH_CACHE_REDIS_URL", "")
+
 RABBITMQ_HOST = "localhost"
 RABBITMQ_QUEUE = "email_queue"
 
@@ -152,3 +172,118 @@ RABBITMQ_QUEUE = "email_queue"
 
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
+# Imports fork their own parsing processes, which prefork pool children cannot
+# do, so they run on a dedicated solo pool worker.
+CELERY_TASK_ROUTES = {
+    "core.tasks.import_contacts_task": {"queue": "imports"},
+}
+
+SMTP_POOL_IDLE_TIMEOUT = int(os.environ.get("SMTP_POOL_IDLE_TIMEOUT", 60))
+SMTP_POOL_MAX_MESSAGES = int(os.environ.get("SMTP_POOL_MAX_MESSAGES", 100))
+SEND_BATCH_SIZE = int(os.environ.get("SEND_BATCH_SIZE", 200))
+FAN_OUT_CHUNK_SIZE = int(os.environ.get("FAN_OUT_CHUNK_SIZE", 5000))
+
+# "smtp" sends each batch sequentially over pooled connections, "asyncio"
+# delivers each batch concurrently through core.delivery.AsyncDeliveryEngine.
+MAIL_DELIVERY_ENGINE = os.environ.get("MAIL_DELIVERY_ENGINE", "smtp")
+# Concurrency caps apply across every batch and worker: each send holds a
+# slot per host and per account in Redis. Slots held by a crashed worker are
+# freed after ASYNC_DELIVERY_SLOT_LEASE seconds. A send that cannot get a slot
+# within ASYNC_DELIVERY_SLOT_WAIT seconds is deferred for that long.
+ASYNC_DELIVERY_HOST_CONCURRENCY = int(
+    os.environ.get("ASYNC_DELIVERY_HOST_CONCURRENCY", 50)
+)
+ASYNC_DELIVERY_ACCOUNT_CONCURRENCY = int(
+    os.environ.get("ASYNC_DELIVERY_ACCOUNT_CONCURRENCY", 10)
+)
+ASYNC_DELIVERY_SLOT_LEASE = int(os.environ.get("ASYNC_DELIVERY_SLOT_LEASE", 300))
+ASYNC_DELIVERY_SLOT_WAIT = float(os.environ.get("ASYNC_DELIVERY_SLOT_WAIT", 10))
+ASYNC_DELIVERY_SLOT_POLL = float(os.environ.get("ASYNC_DELIVERY_SLOT_POLL", 0.1))
+ASYNC_DELIVERY_TIMEOUT = int(os.environ.get("ASYNC_DELIVERY_TIMEOUT", 60))
+
+SMTP_RATE_LIMIT_ENABLED = os.environ.get("SMTP_RATE_LIMIT_ENABLED", "True") == "True"
+SMTP_ACCOUNT_RATE = float(os.environ.get("SMTP_ACCOUNT_RATE", 5))
+SMTP_ACCOUNT_BURST = int(os.environ.get("SMTP_ACCOUNT_BURST", 10))
+SMTP_HOST_RATE = float(os.environ.get("SMTP_HOST_RATE", 50))
+SMTP_HOST_BURST = int(os.environ.get("SMTP_HOST_BURST", 100))
+# Per-host overrides as {"smtp.example.com": (rate, burst)}
+SMTP_HOST_RATE_LIMITS = {}
+
+# Decrypted SMTP passwords are kept in worker memory only, per credentials
+# version, for at most SMTP_CREDS_CACHE_TTL seconds. Saving the credentials
+# only flushes the process that saved them; other workers pick up the new
+# password as soon as they load the new version, and an instance they still
+# hold keeps the old password until the TTL runs out.
+SMTP_CREDS_CACHE_TTL = int(os.environ.get("SMTP_CREDS_CACHE_TTL", 300))
+SMTP_CREDS_CACHE_SIZE = int(os.environ.get("SMTP_CREDS_CACHE_SIZE", 1000))
+
+CAMPAIGN_CONTENT_CACHE_SIZE = int(os.environ.get("CAMPAIGN_CONTENT_CACHE_SIZE", 128))
+CAMPAIGN_MESSAGE_CACHE_BYTES = int(
+    os.environ.get("CAMPAIGN_MESSAGE_CACHE_BYTES", 64 * 1024 * 1024)
+)
+
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get("OUTBOX_RELAY_BATCH_SIZE", 1000))
+OUTBOX_RELAY_INTERVAL = float(os.environ.get("OUTBOX_RELAY_INTERVAL", 1))
+OUTBOX_RETENTION_HOURS = int(os.environ.get("OUTBOX_RETENTION_HOURS", 24))
+
+STATUS_FLUSH_SIZE = int(os.environ.get("STATUS_FLUSH_SIZE", 500))
+STATUS_FLUSH_INTERVAL = float(os.environ.get("STATUS_FLUSH_INTERVAL", 5))
+STATUS_FLUSH_LOCK_TIMEOUT = int(os.environ.get("STATUS_FLUSH_LOCK_TIMEOUT", 60))
+# Status batches taken by a flusher and still unapplied after this many
+# seconds are applied again by the next flush.
+STATUS_PROCESSING_TIMEOUT = int(os.environ.get("STATUS_PROCESSING_TIMEOUT", 600))
+# How long the stats reconcile waits for a running flush to finish.
+STATUS_FLUSH_LOCK_WAIT = float(os.environ.get("STATUS_FLUSH_LOCK_WAIT", 30))
+# Mails are claimed as "sending" before delivery. Claims older than
+# SENDING_TIMEOUT seconds belong to a worker that died mid-send and are
+# marked failed rather than retried, so nothing is sent twice.
+SENDING_TIMEOUT = int(os.environ.get("SENDING_TIMEOUT", 3600))
+CAMPAIGN_STATS_FOLD_INTERVAL = float(os.environ.get("CAMPAIGN_STATS_FOLD_INTERVAL", 60))
+CAMPAIGN_STATS_RECONCILE_INTERVAL = float(
+    os.environ.get("CAMPAIGN_STATS_RECONCILE_INTERVAL", 900)
+)
+MEMBER_COUNT_RECONCILE_INTERVAL = float(
+    os.environ.get("MEMBER_COUNT_RECONCILE_INTERVAL", 3600)
+)
+
+CELERY_BEAT_SCHEDULE = {
+    "flush-outgoing-mail-statuses": {
+        "task": "core.tasks.flush_status_buffer_task",
+        "schedule": STATUS_FLUSH_INTERVAL,
+    },
+    "fold-campaign-stats": {
+        "task": "core.tasks.fold_campaign_stats_task",
+        "schedule": CAMPAIGN_STATS_FOLD_INTERVAL,
+    },
+    "reconcile-campaign-stats": {
+        "task": "core.tasks.reconcile_campaign_stats_task",
+        "schedule": CAMPAIGN_STATS_RECONCILE_INTERVAL,
+    },
+    "fail-stale-sending-mails": {
+        "task": "core.tasks.fail_stale_sending_task",
+        "schedule": SENDING_TIMEOUT / 4,
+    },
+    "reconcile-member-counts": {
+        "task": "core.tasks.reconcile_member_counts_task",
+        "schedule": MEMBER_COUNT_RECONCILE_INTERVAL,
+    },
+}
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 5000))
+
+# "copy" streams imports through a Postgres COPY staging table, "orm" uses
+# chunked bulk_create.
+EMAIL_IMPORT_MODE = os.environ.get("EMAIL_IMPORT_MODE", "copy")
+IMPORT_ERROR_SAMPLES = int(os.environ.get("IMPORT_ERROR_SAMPLES", 20))
+IMPORT_MAX_RETRIES = int(os.environ.get("IMPORT_MAX_RETRIES", 5))
+IMPORT_RETRY_DELAY = int(os.environ.get("IMPORT_RETRY_DELAY", 60))
+
+# Files of at least IMPORT_PARALLEL_MIN_BYTES are split into newline-aligned
+# shards of IMPORT_SHARD_BYTES and parsed by IMPORT_PARSE_WORKERS processes.
+IMPORT_PARSE_WORKERS = int(os.environ.get("IMPORT_PARSE_WORKERS", os.cpu_count() or 1))
+IMPORT_PARALLEL_MIN_BYTES = int(
+    os.environ.get("IMPORT_PARALLEL_MIN_BYTES", 64 * 1024 * 1024)
+)
+IMPORT_SHARD_BYTES = int(os.environ.get("IMPORT_SHARD_BYTES", 8 * 1024 * 1024))
+
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))